@@ -0,0 +1,203 @@
+# agent_runtime.py
+import time
+import asyncio
+import threading
+import weakref
+from contextvars import ContextVar
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import httpx
+import openai
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+
+# ===================== Timestamp helpers =====================
+VIENNA = ZoneInfo("Europe/Vienna")
+
+# case dict the running scan stamps into; bound per task so concurrent scans never mix
+CURRENT_CASE: ContextVar[dict | None] = ContextVar("current_case", default=None)
+# Streamlit session the running scan belongs to (scheduler fairness)
+CURRENT_SESSION: ContextVar[str | None] = ContextVar("current_session", default=None)
+
+
+def _now_vienna_iso() -> str:
+    return datetime.now(VIENNA).isoformat(timespec="milliseconds")
+
+
+def session_case():
+    """st.session_state.current_case of the calling Streamlit script thread (None elsewhere)."""
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return None
+    try:
+        return st.session_state.get("current_case")
+    except Exception:
+        return None
+
+
+def _active_case():
+    case = CURRENT_CASE.get()
+    return case if case is not None else session_case()
+
+
+def stamp_case(field: str) -> None:
+    """
+    Stamp a timestamp into the active test case.
+    First-write-wins: never overwrite a value that is already present.
+    """
+    case = _active_case()
+    if case is None:
+        return
+    if case.get(field) is None:
+        case[field] = _now_vienna_iso()
+
+
+def add_case_usage(**amounts) -> None:
+    """
+    Accumulate usage counters into the active test case (e.g. usage_ocr_bytes=48213).
+    Stored as usage_* columns next to the ts_* timeline.
+    """
+    case = _active_case()
+    if case is None:
+        return
+    for field, amount in amounts.items():
+        case[field] = (case.get(field) or 0) + amount
+
+
+def set_case_field(field: str, value) -> None:
+    """Record a scan detail (e.g. consensus_frame) in the active test case; overwrites, unlike stamp_case."""
+    case = _active_case()
+    if case is not None:
+        case[field] = value
+
+
+def merge_case(fields: dict) -> None:
+    """
+    Merge case fields recorded elsewhere (e.g. by a scan worker process) into the active case:
+    ts_* first-write-wins, usage_* counters add up, backend_unavailable is kept if already set.
+    """
+    case = _active_case()
+    if case is None:
+        return
+    for field, value in fields.items():
+        if field.startswith("usage_"):
+            case[field] = (case.get(field) or 0) + value
+        elif case.get(field) is None:
+            case[field] = value
+
+
+def mark_backend_unavailable(backend: str) -> None:
+    """Record in the active case that a backend ("ocr" / "openai") could not be reached."""
+    case = _active_case()
+    if case is not None:
+        case.setdefault("backend_unavailable", backend)
+
+
+# ===================== Shared event loop =====================
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """One background event loop per process; all sync scan() calls run their coroutine here."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="agent-loop", daemon=True).start()
+    return _loop
+
+
+def submit(coro, case: dict | None = None):
+    """
+    Schedule a coroutine on the shared loop without waiting (concurrent.futures.Future).
+    Stamps inside it go to `case` (None: no case).
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    session_id = ctx.session_id if ctx is not None else None
+
+    async def _bound():
+        CURRENT_CASE.set(case)
+        CURRENT_SESSION.set(session_id)
+        return await coro
+
+    return asyncio.run_coroutine_threadsafe(_bound(), get_loop())
+
+
+def run_sync(coro, case: dict | None = None):
+    """
+    Run a coroutine on the shared loop and block until it is done.
+    The caller's Streamlit case (or the given case dict) is bound to the coroutine
+    so agent stamps still land in it. If the caller is interrupted, the coroutine is cancelled.
+    """
+    future = submit(coro, case if case is not None else session_case())
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
+
+
+# ===================== Pooled async clients (one per event loop) =====================
+_http_clients = weakref.WeakKeyDictionary()
+_openai_clients = weakref.WeakKeyDictionary()
+
+# idle connections stay open long enough for a warm-up at camera start to still help the first scan
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(limits=POOL_LIMITS)
+        _http_clients[loop] = client
+    return client
+
+
+def get_openai_client() -> openai.AsyncOpenAI:
+    loop = asyncio.get_running_loop()
+    client = _openai_clients.get(loop)
+    if client is None:
+        client = openai.AsyncOpenAI(
+            api_key=openai.api_key, http_client=openai.DefaultAsyncHttpxClient(limits=POOL_LIMITS)
+        )
+        _openai_clients[loop] = client
+    return client
+
+
+# ===================== Warm-up =====================
+WARM_TTL_S = 45  # re-warm an agent after this (pooled connections idle out after 60 s)
+
+_warmed = {}
+_warmed_lock = threading.Lock()
+
+
+def warm_up_in_background(agent, case: dict | None = None) -> bool:
+    """
+    Fire-and-forget agent.warm_up_async() on the shared loop: pre-opens pooled connections and
+    initializes clients / indexes so the first scan runs at steady-state latency.
+    With a case (camera start) it always runs and stamps ts_warmup_started / ts_warmup_done;
+    without one (task selected) it is skipped if the agent was warmed within WARM_TTL_S.
+    """
+    warm = getattr(agent, "warm_up_async", None)
+    if warm is None:
+        return False
+    key = (type(agent).__name__, getattr(agent, "agent_name", None))
+    now = time.monotonic()
+    with _warmed_lock:
+        if case is None and now - _warmed.get(key, float("-inf")) < WARM_TTL_S:
+            return False
+        _warmed[key] = now
+
+    async def _run():
+        stamp_case("ts_warmup_started")
+        try:
+            await warm()
+        except Exception as e:
+            print("⚠️ Warm-up failed:", e)
+        stamp_case("ts_warmup_done")
+
+    submit(_run(), case)
+    return True
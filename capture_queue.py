@@ -0,0 +1,195 @@
+# capture_queue.py
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime
+
+from agent_runtime import VIENNA, run_sync
+from persistence import RESULTS_DIR, update_result
+from image_ingest import decode_upload
+
+QUEUE_PATH = os.path.join(RESULTS_DIR, "capture_queue.sqlite3")
+
+# agent stamps copied into the saved row when a queued capture is processed
+_AGENT_STAMPS = ("ts_scan_started", "ts_ocr_result", "ts_gpt_result", "ts_gpt_verification")
+
+
+def _make_agent(agent_name: str):
+    """Fresh agent by UI name (imported lazily - the queue is also used without the UI)."""
+    from scan_client import RemoteScanAgent, scan_worker_url, ocr_endpoints
+    if scan_worker_url():
+        return RemoteScanAgent(agent_name)
+    if agent_name == "SerialNumberAgent":
+        from serial_number_agent import SerialNumberAgent
+        return SerialNumberAgent(**ocr_endpoints())
+    if agent_name == "SerialNumberKnowledgeAgent":
+        from serial_number_knowledge_agent import SerialNumberKnowledgeAgent
+        return SerialNumberKnowledgeAgent(**ocr_endpoints())
+    if agent_name == "ScannerAgent":
+        from scanner_agent import ScannerAgent
+        return ScannerAgent(**ocr_endpoints())
+    raise ValueError(f"No deferred processing for agent {agent_name!r}")
+
+
+class CaptureQueue:
+    """
+    Durable queue of captures taken while the OCR server / OpenAI was unreachable (SQLite).
+
+    - the UI saves the frame + a "queued" row right away and enqueues the case
+    - a background worker drains the queue (at most drain_per_min scans) once backends are back,
+      retrying with exponential backoff while they are still down
+    - results are backfilled into the saved row; the original ts_scan_pressed is kept
+    """
+
+    def __init__(self, path: str = QUEUE_PATH, drain_per_min: float = 30, down_for_s: float = 30,
+                 max_attempts: int = 50):
+        self.path = path
+        self.min_interval_s = 60.0 / max(drain_per_min, 0.1)
+        self.down_for_s = down_for_s
+        self.max_attempts = max_attempts
+        self._down_until = {}      # backend -> time.time() until which we skip live scans
+        self._agents = {}          # agent_name -> agent (worker thread only)
+        self._worker = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, case_id TEXT, agent TEXT, task TEXT, input_type TEXT,"
+            " image_path TEXT, status TEXT, attempts INTEGER, next_attempt_at REAL, last_error TEXT,"
+            " created REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs(status, next_attempt_at)")
+
+    # ----------------- circuit breaker -----------------
+
+    def mark_down(self, backend: str):
+        """A live scan could not reach backend: queue new captures instead of scanning for a while."""
+        with self._lock:
+            self._down_until[backend] = time.time() + self.down_for_s
+
+    def backends_down(self) -> list[str]:
+        now = time.time()
+        with self._lock:
+            return [b for b, until in self._down_until.items() if until > now]
+
+    def _mark_up(self):
+        with self._lock:
+            self._down_until.clear()
+
+    # ----------------- queue -----------------
+
+    def enqueue(self, row: dict) -> int:
+        """Queue a saved "queued" row (needs case_id, agent, image_path) for deferred scanning."""
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO jobs (case_id, agent, task, input_type, image_path, status, attempts,"
+                " next_attempt_at, last_error, created) VALUES (?, ?, ?, ?, ?, 'pending', 0, ?, NULL, ?)",
+                (row["case_id"], row["agent"], row.get("task"), row.get("input_type"), row["image_path"],
+                 time.time(), time.time()),
+            )
+        self._wake.set()
+        return cur.lastrowid
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pending'").fetchone()[0]
+
+    def _next_due(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, case_id, agent, image_path, attempts FROM jobs"
+                " WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+
+    def _set_status(self, job_id, status, error=None):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, last_error = ? WHERE id = ?", (status, error, job_id))
+
+    def _retry(self, job_id, attempts, error):
+        delay = min(5 * 2 ** attempts, 600)
+        status = "pending" if attempts + 1 < self.max_attempts else "failed"
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (status, attempts + 1, time.time() + delay, error, job_id),
+            )
+
+    # ----------------- worker -----------------
+
+    def ensure_worker(self):
+        """Start the background drain thread once per process."""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._drain_forever, name="capture-queue", daemon=True)
+                self._worker.start()
+
+    def _drain_forever(self):
+        while True:
+            job = self._next_due()
+            if job is None:
+                self._wake.wait(timeout=5)
+                self._wake.clear()
+                continue
+            try:
+                self._process(*job)
+            except Exception as e:
+                print("❌ Capture queue job failed:", e)
+                self._retry(job[0], job[4], str(e))
+            time.sleep(self.min_interval_s)  # drain rate limit
+
+    def _process(self, job_id, case_id, agent_name, image_path, attempts):
+        if not os.path.exists(image_path):
+            self._set_status(job_id, "failed", f"image missing: {image_path}")
+            return
+
+        with open(image_path, "rb") as f:
+            pil_img = decode_upload(f.read())  # same scan resolution as a live upload
+
+        agent = self._agents.get(agent_name)
+        if agent is None:
+            agent = self._agents[agent_name] = _make_agent(agent_name)
+
+        case = {"case_id": case_id}
+        result = run_sync(agent.scan_async(pil_img, task_type="batch"), case=case)
+
+        backend = case.get("backend_unavailable")
+        if backend:
+            print(f"📥 Backend '{backend}' still unavailable - case {case_id} stays queued.")
+            self.mark_down(backend)
+            self._retry(job_id, attempts, f"{backend} unavailable")
+            return
+
+        self._mark_up()
+        serial_number, conf = result[0], result[1]  # knowledge agent adds (is_known_good, source)
+        updates = {k: case.get(k) for k in _AGENT_STAMPS}
+        updates.update({k: v for k, v in case.items() if k.startswith("usage_")})
+        updates.update({
+            "serial_number": serial_number,
+            "confidence": float(conf) if serial_number and conf is not None else None,
+            "scan_status": "backfilled" if serial_number else "backfilled-no-serial",
+            "ts_backfilled": datetime.now(VIENNA).isoformat(timespec="milliseconds"),
+        })
+        if not update_result(case_id, updates):
+            # placeholder row gone (deleted / rewritten): keep the job visible instead of losing the result
+            print(f"❌ No saved row for case {case_id} - backfill of {serial_number!r} not written.")
+            self._set_status(job_id, "failed", f"no saved row for case {case_id} (result: {serial_number!r})")
+            return
+        self._set_status(job_id, "done")
+        print(f"📤 Backfilled case {case_id}: {serial_number}")
+
+
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_capture_queue() -> CaptureQueue:
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            _QUEUE = CaptureQueue(drain_per_min=float(os.getenv("CAPTURE_DRAIN_PER_MIN", "30")))
+    return _QUEUE
@@ -0,0 +1,119 @@
+# consensus.py
+import asyncio
+from collections import Counter, defaultdict
+
+from agent_runtime import add_case_usage, set_case_field
+from ocr_client import ocr_image, ocr_images
+from serial_index import normalize_serial
+
+
+def vote(reads):
+    """
+    Character-level vote over OCR reads [(serial, confidence), ...] of the same plate (one per frame).
+
+    Reads of the most common (normalized) length vote per position, weighted by confidence.
+    agreement: winning characters' share of ALL reads' weight, averaged over positions
+    (reads of another length count against it). Frames without a serial don't vote.
+    Returns {"serial", "agreement", "agreeing", "confidence", "votes"}; serial is None if nothing was read.
+    """
+    usable = []
+    for serial, conf in reads:
+        key = normalize_serial(serial or "")
+        if key:
+            usable.append((key, max(float(conf or 0.0), 0.01)))
+    if not usable:
+        return {"serial": None, "agreement": 0.0, "agreeing": 0, "confidence": 0.0, "votes": 0}
+
+    length = Counter(len(s) for s, _ in usable).most_common(1)[0][0]
+    total = sum(w for _, w in usable)
+    chars, shares = [], []
+    for i in range(length):
+        weights = defaultdict(float)
+        for s, w in usable:
+            if len(s) == length:
+                weights[s[i]] += w
+        ch, w = max(weights.items(), key=lambda kv: kv[1])
+        chars.append(ch)
+        shares.append(w / total)
+
+    serial = "".join(chars)
+    agreeing = [w for s, w in usable if s == serial]
+    same_length = [w for s, w in usable if len(s) == length]
+    confs = agreeing or same_length
+    return {
+        "serial": serial,
+        "agreement": sum(shares) / length,
+        "agreeing": len(agreeing),
+        "confidence": sum(confs) / len(confs),
+        "votes": len(usable),
+    }
+
+
+def _accepted(result, min_agree, min_agreement, min_conf):
+    return (
+        result["serial"] is not None
+        and result["agreeing"] >= min_agree
+        and result["agreement"] >= min_agreement
+        and result["confidence"] >= min_conf
+    )
+
+
+async def ocr_consensus(api_url: str, frames: list, *, batch_api_url: str | None = None, min_agree: int = 2,
+                        min_agreement: float = 0.8, min_conf: float = 0.6, early_accept: float | None = None,
+                        timeout: float = 10):
+    """
+    OCR the last K camera frames at once and vote (see vote()).
+
+    - with a batch endpoint: ONE request for all frames, voted when it returns
+    - otherwise: concurrent single requests; as soon as min_agree frames read the same serial
+      (agreement >= min_agreement, mean confidence >= min_conf) - or a single read reaches
+      early_accept - the remaining requests are cancelled
+    Returns the vote plus "accepted", "answered" (frames the OCR server answered), "frame" (index of
+    the newest frame that read the voted serial, else the newest frame) and "text_boxes" of that frame.
+    "serial" is that frame's raw read (same form as a single-frame scan); the normalized vote key
+    only if no frame read it exactly. The frame index is also recorded in the active case as
+    "consensus_frame", so callers that only get (serial, conf) back can keep the image it came from.
+    """
+    reads = [None] * len(frames)  # (serial, conf, text_boxes) per frame, None while pending
+
+    if batch_api_url:
+        batch = await ocr_images(api_url, frames, batch_api_url=batch_api_url, timeout=timeout)
+        reads = [(serial, conf, None) for serial, conf in batch]
+    else:
+        async def _read(i):
+            return i, await ocr_image(api_url, frames[i], timeout, with_boxes=True)
+
+        pending = {asyncio.ensure_future(_read(i)) for i in range(len(frames))}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    i, read = task.result()
+                    reads[i] = read
+                answered = [r for r in reads if r is not None and r[1] is not None]
+                single = early_accept is not None and any(s and c >= early_accept for s, c, _ in answered)
+                if single or _accepted(vote([r[:2] for r in answered]), min_agree, min_agreement, min_conf):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+
+    answered = [(i, r) for i, r in enumerate(reads) if r is not None and r[1] is not None]
+    add_case_usage(usage_ocr_frames=len(answered))
+    result = vote([r[:2] for _, r in answered])
+
+    strong = [(i, r) for i, r in answered if early_accept is not None and r[0] and r[1] >= early_accept]
+    if strong:  # one confident frame is enough, like the single-frame early accept
+        i, (serial, conf, boxes) = max(strong, key=lambda item: item[1][1])
+        result.update(serial=serial.strip(), confidence=float(conf), accepted=True)
+    else:
+        result["accepted"] = _accepted(result, min_agree, min_agreement, min_conf)
+        matching = [i for i, r in answered if normalize_serial(r[0] or "") == result["serial"]]
+        i = max(matching) if matching else len(frames) - 1
+        boxes = reads[i][2] if reads[i] is not None else None
+        if matching:
+            result["serial"] = reads[i][0].strip()
+
+    result.update(answered=len(answered), frame=i, text_boxes=boxes)
+    set_case_field("consensus_frame", i)
+    return result
@@ -1,3 +1,277 @@
+# damage_detection_agent.py
+import os
+import asyncio
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+from agent_runtime import run_sync
+from scan_scheduler import get_scheduler
+
+
+# ===================== Detectors =====================
+class EdgeTextureDetector:
+    """
+    Classical CPU baseline: split a tile into cells, measure edge energy and texture
+    (local variance) per cell and flag cells that are robust outliers against the rest
+    of the tile (median / MAD z-score). Dents, scratches, cracks and missing paint
+    show up as breaks in an otherwise uniform panel texture.
+
+    Any picklable object with detect(tile) -> (N, 5) array [x0, y0, x1, y1, score]
+    (tile pixel coords, score in 0..1) can be plugged into DamageDetectionAgent.
+    """
+
+    name = "edge-texture"
+
+    def __init__(self, cell: int = 32, z_threshold: float = 4.0, min_mad: float = 2.0):
+        self.cell = cell
+        self.z_threshold = z_threshold
+        self.min_mad = min_mad  # keeps perfectly uniform tiles from producing noise detections
+
+    def detect(self, tile: np.ndarray) -> np.ndarray:
+        gray = tile.astype(np.float32)
+        if gray.ndim == 3:
+            gray = gray @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+        c = self.cell
+        gh, gw = gray.shape[0] // c, gray.shape[1] // c
+        if gh < 2 or gw < 2:
+            return np.empty((0, 5), dtype=np.float32)
+        gray = gray[: gh * c, : gw * c]
+
+        gx = np.abs(np.diff(gray, axis=1, append=gray[:, -1:]))
+        gy = np.abs(np.diff(gray, axis=0, append=gray[-1:, :]))
+        cells = lambda a: a.reshape(gh, c, gw, c)
+        edge = cells(gx + gy).mean(axis=(1, 3))
+        texture = cells(gray).std(axis=(1, 3))
+
+        z = np.maximum(self._robust_z(edge), self._robust_z(texture))
+        anomalous = z > self.z_threshold
+        if not anomalous.any():
+            return np.empty((0, 5), dtype=np.float32)
+
+        boxes = []
+        for cells_yx in self._components(anomalous):
+            ys, xs = cells_yx[:, 0], cells_yx[:, 1]
+            score = 1.0 - np.exp(-(z[ys, xs].max() - self.z_threshold) / self.z_threshold)
+            boxes.append((xs.min() * c, ys.min() * c, (xs.max() + 1) * c, (ys.max() + 1) * c, score))
+        return np.asarray(boxes, dtype=np.float32)
+
+    def _robust_z(self, values: np.ndarray) -> np.ndarray:
+        med = np.median(values)
+        mad = max(np.median(np.abs(values - med)) * 1.4826, self.min_mad)
+        return (values - med) / mad
+
+    @staticmethod
+    def _components(mask: np.ndarray):
+        """4-connected components of a (small) cell grid."""
+        seen = np.zeros_like(mask)
+        for start in zip(*np.nonzero(mask)):
+            if seen[start]:
+                continue
+            stack, comp = [start], []
+            seen[start] = True
+            while stack:
+                y, x = stack.pop()
+                comp.append((y, x))
+                for ny, nx in ((y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1)):
+                    if 0 <= ny < mask.shape[0] and 0 <= nx < mask.shape[1] and mask[ny, nx] and not seen[ny, nx]:
+                        seen[ny, nx] = True
+                        stack.append((ny, nx))
+            yield np.asarray(comp)
+
+
+# ===================== Tiling / NMS =====================
+def make_tiles(width: int, height: int, tile_size: int, overlap: int):
+    """Overlapping (x0, y0, x1, y1) tiles covering the whole image; edge tiles are shifted inwards."""
+    step = max(1, tile_size - overlap)
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        s = list(range(0, length - tile_size, step))
+        return s + [length - tile_size]
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def fuse_across_tiles(dets: np.ndarray, tile_ids: np.ndarray, gap: float = 2.0) -> np.ndarray:
+    """
+    Union boxes from DIFFERENT tiles that overlap or touch (within gap px): one defect cut by a
+    tile boundary comes back as one box (score = max). Boxes of the same tile are left alone.
+    """
+    n = len(dets)
+    if n < 2:
+        return dets
+    x0, y0, x1, y1 = dets[:, :4].T
+    touch_x = np.minimum(x1[:, None], x1[None]) - np.maximum(x0[:, None], x0[None]) >= -gap
+    touch_y = np.minimum(y1[:, None], y1[None]) - np.maximum(y0[:, None], y0[None]) >= -gap
+    pairs = np.argwhere(np.triu(touch_x & touch_y & (tile_ids[:, None] != tile_ids[None]), 1))
+    if not len(pairs):
+        return dets
+
+    parent = np.arange(n)
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        parent[root(i)] = root(j)
+    groups = np.array([root(i) for i in range(n)])
+
+    fused = []
+    for g in np.unique(groups):
+        members = dets[groups == g]
+        fused.append([members[:, 0].min(), members[:, 1].min(), members[:, 2].max(), members[:, 3].max(),
+                      members[:, 4].max()])
+    return np.asarray(fused, dtype=dets.dtype)
+
+
+def non_max_suppression(dets: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Greedy NMS over (N, 5) [x0, y0, x1, y1, score]; IoU against all remaining boxes at once."""
+    if len(dets) == 0:
+        return dets
+    x0, y0, x1, y1, scores = dets.T
+    areas = (x1 - x0) * (y1 - y0)
+    order = np.argsort(-scores)
+
+    keep = []
+    while order.size:
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        iw = np.clip(np.minimum(x1[i], x1[rest]) - np.maximum(x0[i], x0[rest]), 0, None)
+        ih = np.clip(np.minimum(y1[i], y1[rest]) - np.maximum(y0[i], y0[rest]), 0, None)
+        inter = iw * ih
+        iou = inter / (areas[i] + areas[rest] - inter)
+        # also drop boxes mostly contained in the kept one (same defect seen by two tiles)
+        contained = inter / np.maximum(areas[rest], 1e-6)
+        order = rest[(iou <= iou_threshold) & (contained <= 0.8)]
+    return dets[keep]
+
+
+# ===================== Process pool worker =====================
+def _detect_tile_shm(shm_name, shape, dtype, tile, detector):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        x0, y0, x1, y1 = tile
+        dets = detector.detect(image[y0:y1, x0:x1])
+    finally:
+        shm.close()
+    if len(dets):
+        dets = dets.copy()
+        dets[:, [0, 2]] += x0
+        dets[:, [1, 3]] += y0
+    return dets
+
+
+def _ready():
+    return os.getpid()
+
+
+_POOL = None
+
+
+def _get_pool(max_workers: int) -> ProcessPoolExecutor:
+    # one process pool per server process; spawn keeps workers independent of Streamlit threads
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context("spawn"))
+    return _POOL
+
+
+# ===================== Agent =====================
 class DamageDetectionAgent:
+    """
+    CPU-only damage detection for high-resolution fuselage photos.
+
+    Pipeline:
+      1) split into overlapping tiles
+      2) score each tile with a pluggable detector (process pool, image in shared memory)
+      3) fuse boxes of one defect split across tiles, then non-max suppression
+
+    detect() returns a list of {"bbox": [x0, y0, x1, y1], "score": float}, best first.
+    """
+
+    task_type = "damage_detection"  # scheduler priority class
+
+    def __init__(self, detector=None, tile_size: int = 512, overlap: int = 64,
+                 iou_threshold: float = 0.3, score_threshold: float = 0.2,
+                 max_workers: int | None = None):
+        self.detector = detector or EdgeTextureDetector()
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.iou_threshold = iou_threshold
+        self.score_threshold = score_threshold
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+
     def get_status(self):
-        return "🛠️ This feature will come in the near future. Stay tuned!"
+        return f"CPU damage detection ({getattr(self.detector, 'name', type(self.detector).__name__)}, " \
+               f"{self.tile_size}px tiles, {self.max_workers} worker(s))"
+
+    async def warm_up_async(self):
+        """Spawn the process pool (interpreter start + imports) before the first photo."""
+        if self.max_workers > 1:
+            pool = _get_pool(self.max_workers)
+            await asyncio.gather(*(asyncio.wrap_future(pool.submit(_ready)) for _ in range(self.max_workers)))
+
+    def _detect(self, pil_img: Image.Image):
+        print("🔍 Starting damage detection...")
+        image = np.asarray(pil_img.convert("RGB"))
+        tiles = make_tiles(image.shape[1], image.shape[0], self.tile_size, self.overlap)
+
+        if len(tiles) == 1 or self.max_workers == 1:
+            per_tile = [self._detect_inline(image, t) for t in tiles]
+        else:
+            per_tile = self._detect_parallel(image, tiles)
+
+        dets = np.concatenate([d for d in per_tile if len(d)] or [np.empty((0, 5), dtype=np.float32)])
+        tile_ids = np.concatenate([np.full(len(d), i) for i, d in enumerate(per_tile)] or [np.empty(0, dtype=int)])
+        keep = dets[:, 4] >= self.score_threshold
+        dets = fuse_across_tiles(dets[keep], tile_ids[keep])  # defects crossing tile boundaries
+        dets = non_max_suppression(dets, self.iou_threshold)
+
+        print(f"🛠️ {len(dets)} damage candidate(s) from {len(tiles)} tile(s)")
+        return [{"bbox": [int(v) for v in d[:4]], "score": float(d[4])} for d in dets]
+
+    async def detect_async(self, pil_img: Image.Image, *, task_type: str | None = None):
+        """Detect through the process-wide scheduler; the CPU work runs in a worker thread."""
+        return await get_scheduler().run(
+            lambda: asyncio.to_thread(self._detect, pil_img), task_type=task_type or self.task_type
+        )
+
+    def detect(self, pil_img: Image.Image):
+        """Blocking wrapper around detect_async() (runs on the shared agent event loop)."""
+        return run_sync(self.detect_async(pil_img))
+
+    def _detect_inline(self, image, tile):
+        x0, y0, x1, y1 = tile
+        dets = self.detector.detect(image[y0:y1, x0:x1])
+        if len(dets):
+            dets[:, [0, 2]] += x0
+            dets[:, [1, 3]] += y0
+        return dets
+
+    def _detect_parallel(self, image, tiles):
+        shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+        try:
+            np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[:] = image
+            pool = _get_pool(self.max_workers)
+            futures = [
+                pool.submit(_detect_tile_shm, shm.name, image.shape, image.dtype, t, self.detector)
+                for t in tiles
+            ]
+            return [f.result() for f in futures]
+        finally:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,97 @@
+# duplicate_index.py
+import os
+import time
+import threading
+from datetime import datetime
+
+from serial_index import normalize_serial
+
+
+def _saved_at(row: dict) -> float:
+    """Epoch seconds a row was saved (ts_result_saved, else timestamp_iso; naive = server-local)."""
+    for field in ("ts_result_saved", "timestamp_iso"):
+        value = row.get(field)
+        if value:
+            try:
+                return datetime.fromisoformat(value).timestamp()
+            except ValueError:
+                pass
+    return time.time()
+
+
+class DuplicateIndex:
+    """
+    Saved serials for duplicate checks at save time, O(1) per lookup:
+      - (serial, experiment_id) -> first save of that serial in the experiment
+      - serial -> most recent save in any experiment (caught within window_s, e.g. another tablet)
+    Serials are normalized like the prefix index ('11148 a' == '11148A').
+    """
+
+    def __init__(self, window_s: float = 600):
+        self.window_s = window_s
+        self._by_experiment = {}   # (serial, experiment_id) -> record
+        self._latest = {}          # serial -> record
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_experiment)
+
+    def add(self, row: dict):
+        key = normalize_serial(str(row.get("serial_number") or ""))
+        if not key:
+            return  # queued / damage / empty rows
+        record = {
+            "serial_number": str(row.get("serial_number")).strip(),
+            "experiment_id": row.get("experiment_id") or "",
+            "case_id": row.get("case_id") or "",
+            "agent": row.get("agent") or "",
+            "saved_at": _saved_at(row),
+        }
+        with self._lock:
+            self._by_experiment.setdefault((key, record["experiment_id"]), record)
+            latest = self._latest.get(key)
+            if latest is None or record["saved_at"] >= latest["saved_at"]:
+                self._latest[key] = record
+
+    def find(self, serial: str, experiment_id: str | None, now: float | None = None):
+        """
+        Earlier save of this serial: same experiment (any time) or any experiment within window_s.
+        Returns the record dict (plus "same_experiment") or None.
+        """
+        key = normalize_serial(serial)
+        if not key:
+            return None
+        with self._lock:
+            record = self._by_experiment.get((key, experiment_id or ""))
+            if record is not None:
+                return {**record, "same_experiment": True}
+            record = self._latest.get(key)
+        if record is not None and (now or time.time()) - record["saved_at"] <= self.window_s:
+            return {**record, "same_experiment": False}
+        return None
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_duplicate_index() -> DuplicateIndex:
+    """
+    Process-wide index, built once by streaming the saved results,
+    then kept up to date by a persistence save listener (appends and backfills).
+    """
+    global _INDEX
+    if _INDEX is not None:
+        return _INDEX
+
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            import persistence
+
+            index = DuplicateIndex(window_s=float(os.getenv("DUPLICATE_WINDOW_MIN", "10")) * 60)
+            for row in persistence.iter_results():
+                index.add(row)
+
+            persistence.add_save_listener(index.add)
+            _INDEX = index
+    return _INDEX
@@ -0,0 +1,244 @@
+# evaluate_thresholds.py
+"""
+Threshold sweep for the serial pipeline on a labeled image set.
+
+    python evaluate_thresholds.py labels.csv --out sweep.csv
+
+labels.csv has the columns image_path, expected_serial (paths relative to the CSV).
+Every stage (OCR, GPT extraction, GPT verification) runs ONCE per image and its output +
+latency is cached in results/eval_stage_cache.json; the sweep over
+ocr_early_accept_threshold x min_ocr_conf_to_save is then computed with NumPy over the
+cached outputs - re-running with other grids costs no backend calls.
+"""
+import os
+import csv
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+
+import numpy as np
+
+# measure real model latency on the first pass (the stage cache is the reuse layer here)
+os.environ.setdefault("VISION_CACHE_MODE", "record")
+
+from agent_runtime import run_sync
+from scan_scheduler import get_scheduler
+from serial_number_agent import SerialNumberAgent
+from serial_index import normalize_serial
+from image_ingest import decode_upload
+from label_regions import crop_to_serial
+from persistence import RESULTS_DIR
+
+STAGE_CACHE_PATH = os.path.join(RESULTS_DIR, "eval_stage_cache.json")
+
+EARLY_ACCEPT_GRID = np.round(np.arange(0.50, 1.0001, 0.01), 2)
+MIN_SAVE_GRID = np.round(np.arange(0.0, 0.951, 0.05), 2)  # 0.0 == filter off
+
+
+# ===================== Labels / stage cache =====================
+def read_labels(path: str):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    return [
+        (os.path.join(base, r["image_path"]), r.get("expected_serial") or r.get("serial_number") or "")
+        for r in rows
+    ]
+
+
+def _load_stage_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_stage_cache(path, cache):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+
+def _stage_key(raw: bytes, agent: SerialNumberAgent) -> str:
+    return hashlib.sha256(raw + agent.api_url.encode()).hexdigest()
+
+
+# ===================== Stage runner =====================
+async def _run_stages(agent: SerialNumberAgent, pil_img):
+    """All three stages regardless of thresholds (the sweep decides which ones a policy would use)."""
+    t0 = time.perf_counter()
+    ocr_serial, ocr_conf, text_boxes = await agent._try_ocr_api(pil_img)
+    t1 = time.perf_counter()
+    gpt_img = crop_to_serial(pil_img, text_boxes)  # same GPT input as the live pipeline
+    gpt_serial = await agent._gpt_extract_serial(gpt_img)
+    t2 = time.perf_counter()
+    verified = await agent._gpt_verify_serial(gpt_img, ocr_serial, gpt_serial)
+    t3 = time.perf_counter()
+    return {
+        "ocr_serial": ocr_serial,
+        "ocr_conf": ocr_conf,
+        "gpt_serial": gpt_serial,
+        "verified": verified,
+        "ocr_ms": (t1 - t0) * 1000,
+        "gpt_ms": (t2 - t1) * 1000,
+        "verify_ms": (t3 - t2) * 1000,
+    }
+
+
+async def _collect(agent, todo, concurrency):
+    scheduler = get_scheduler()
+    limit = asyncio.Semaphore(concurrency)  # stay below the scheduler's queue limit
+
+    async def _one(path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        pil_img = await asyncio.to_thread(decode_upload, raw)  # same scale as a live upload
+        async with limit:
+            out = await scheduler.run(lambda: _run_stages(agent, pil_img), task_type="batch")
+        return _stage_key(raw, agent), out
+
+    return await asyncio.gather(*(_one(p) for p in todo))
+
+
+def collect_stage_outputs(labels, agent, cache_path=STAGE_CACHE_PATH, concurrency=4):
+    """Stage outputs per labeled image; only images missing from the cache hit the backends."""
+    cache = _load_stage_cache(cache_path)
+    keys = {}
+    todo = []
+    for path, _ in labels:
+        with open(path, "rb") as f:
+            key = _stage_key(f.read(), agent)
+        keys[path] = key
+        if key not in cache:
+            todo.append(path)
+
+    if todo:
+        print(f"🔍 Running pipeline stages for {len(todo)} image(s) ({len(labels) - len(todo)} cached)...")
+        for key, out in run_sync(_collect(agent, todo, concurrency)):
+            cache[key] = out
+        _save_stage_cache(cache_path, cache)
+    else:
+        print(f"♻️ All {len(labels)} image(s) served from the stage cache.")
+
+    return [cache[keys[path]] for path, _ in labels]
+
+
+# ===================== Vectorized sweep =====================
+def sweep(outputs, expected, early_grid=EARLY_ACCEPT_GRID, min_save_grid=MIN_SAVE_GRID):
+    """
+    Simulate SerialNumberAgent/ScannerAgent for every (early accept, min save) pair at once.
+    Returns a dict of (len(early_grid), len(min_save_grid)) metric arrays.
+    """
+    truth = np.array([normalize_serial(e) for e in expected])
+    ocr_serial = np.array([normalize_serial(o["ocr_serial"]) for o in outputs])
+    verified = np.array([normalize_serial(o["verified"]) for o in outputs])
+    ocr_ok = np.array([o["ocr_conf"] is not None for o in outputs])
+    conf = np.array([o["ocr_conf"] if o["ocr_conf"] is not None else -1.0 for o in outputs], dtype=float)
+    ocr_ms = np.array([o["ocr_ms"] for o in outputs])
+    gpt_ms = np.array([o["gpt_ms"] + o["verify_ms"] for o in outputs])
+
+    ocr_right = ocr_serial == truth
+    verified_right = verified == truth
+
+    # axes: (early accept threshold, min save threshold, image)
+    t = np.asarray(early_grid, dtype=float)[:, None, None]
+    m = np.asarray(min_save_grid, dtype=float)[None, :, None]
+
+    early = ocr_ok & (ocr_serial != "") & (conf >= t)                 # (T, 1, N)
+    uses_gpt = ocr_ok & ~early                                         # OCR down -> scan aborts, no GPT
+    answered = early | (uses_gpt & (verified != ""))
+    right = (early & ocr_right) | (uses_gpt & (verified != "") & verified_right)
+    kept = answered & (conf >= m)                                      # (T, M, N)
+    kept_right = right & (conf >= m)
+
+    latency = ocr_ms + uses_gpt * gpt_ms                               # (T, 1, N)
+    n = len(outputs)
+    shape = (len(early_grid), len(min_save_grid))
+    saved = kept.sum(-1)
+    return {
+        "early_accept": np.broadcast_to(t[..., 0], shape),
+        "min_save": np.broadcast_to(m[..., 0], shape),
+        "accuracy": kept_right.sum(-1) / n,                            # right serial saved
+        "precision": np.divide(kept_right.sum(-1), saved, out=np.zeros(shape), where=saved > 0),
+        "coverage": saved / n,
+        "wrong_saved": (kept & ~kept_right).sum(-1) / n,
+        "gpt_calls_per_image": np.broadcast_to(2 * uses_gpt.sum(-1) / n, shape),
+        "latency_mean_ms": np.broadcast_to(latency.mean(-1), shape),
+        "latency_p95_ms": np.broadcast_to(np.percentile(latency, 95, axis=-1), shape),
+    }
+
+
+def recommend(result, min_accuracy):
+    """Setting with the fewest GPT calls (then lowest latency, then fewest wrong saves) at >= min_accuracy."""
+    ok = result["accuracy"] >= min_accuracy
+    if not ok.any():
+        return None
+    order = np.lexsort((
+        result["wrong_saved"][ok],
+        result["latency_mean_ms"][ok],
+        result["gpt_calls_per_image"][ok],
+    ))
+    idx = np.argwhere(ok)[order[0]]
+    return tuple(idx)
+
+
+def write_sweep_csv(path, result):
+    names = list(result)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(names)
+        for row in zip(*(result[k].ravel() for k in names)):
+            w.writerow([f"{v:.4f}" for v in row])
+
+
+def _print_setting(result, idx, label):
+    r = {k: float(v[idx]) for k, v in result.items()}
+    min_save = f"{r['min_save']:.2f}" if r["min_save"] > 0 else "off"
+    print(
+        f"{label:<22} early_accept={r['early_accept']:.2f} min_save={min_save:<4} "
+        f"acc={r['accuracy']:.3f} prec={r['precision']:.3f} cov={r['coverage']:.3f} "
+        f"gpt/img={r['gpt_calls_per_image']:.2f} latency={r['latency_mean_ms']:.0f} ms "
+        f"(p95 {r['latency_p95_ms']:.0f})"
+    )
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("labels", help="CSV with image_path, expected_serial")
+    p.add_argument("--api-url", default="http://168.119.242.186:8500/scan_serial")
+    p.add_argument("--cache", default=STAGE_CACHE_PATH, help="stage output cache (JSON)")
+    p.add_argument("--concurrency", type=int, default=4, help="images in flight while collecting stages")
+    p.add_argument("--min-accuracy", type=float, default=None,
+                   help="accuracy floor for the recommendation (default: best accuracy - 0.01)")
+    p.add_argument("--out", help="write the full sweep grid to this CSV")
+    args = p.parse_args(argv)
+
+    labels = read_labels(args.labels)
+    agent = SerialNumberAgent(api_url=args.api_url)
+    outputs = collect_stage_outputs(labels, agent, args.cache, args.concurrency)
+    result = sweep(outputs, [e for _, e in labels])
+
+    if args.out:
+        write_sweep_csv(args.out, result)
+        print(f"💾 Sweep grid written to {args.out}")
+
+    print(f"\n📊 {len(labels)} labeled image(s)")
+    current = (int(np.argmin(np.abs(EARLY_ACCEPT_GRID - 0.95))), 0)
+    _print_setting(result, current, "current default")
+    best = np.unravel_index(np.argmax(result["accuracy"]), result["accuracy"].shape)
+    _print_setting(result, best, "best accuracy")
+
+    min_accuracy = args.min_accuracy if args.min_accuracy is not None else float(result["accuracy"][best]) - 0.01
+    pick = recommend(result, min_accuracy)
+    if pick is None:
+        print(f"⚠️ No setting reaches accuracy {min_accuracy:.3f}.")
+    else:
+        _print_setting(result, pick, f"fewest GPT @acc>={min_accuracy:.2f}")
+
+
+if __name__ == "__main__":
+    main()
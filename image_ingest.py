@@ -0,0 +1,38 @@
+# image_ingest.py
+import io
+from PIL import Image, ImageOps
+
+SCAN_MAX_SIDE = 2048     # enough resolution for OCR/GPT on a data plate
+PREVIEW_MAX_SIDE = 1024  # what the browser actually gets to render
+
+
+def _open_oriented(raw: bytes, max_side: int | None) -> Image.Image:
+    img = Image.open(io.BytesIO(raw))  # lazy: only the header is parsed here
+    if max_side and img.format == "JPEG":
+        # JPEG DCT scaling: decode directly at 1/2, 1/4 or 1/8 size (>= max_side)
+        img.draft("RGB", (max_side, max_side))
+    img = ImageOps.exif_transpose(img)  # phone photos are often stored rotated
+    if max_side and max(img.size) > max_side:
+        img.thumbnail((max_side, max_side))
+    return img.convert("RGB")
+
+
+def decode_upload(raw: bytes, max_side: int = SCAN_MAX_SIDE) -> Image.Image:
+    """
+    Decode an uploaded file for scanning: reduced scale, EXIF orientation applied.
+    12-48 MP phone photos never get decoded at full resolution here.
+    """
+    return _open_oriented(raw, max_side)
+
+
+def decode_full(raw: bytes) -> Image.Image:
+    """Full-resolution decode (EXIF orientation applied). Only used when the image is persisted."""
+    return _open_oriented(raw, None)
+
+
+def make_preview(pil_img: Image.Image, max_side: int = PREVIEW_MAX_SIDE) -> Image.Image:
+    if max(pil_img.size) <= max_side:
+        return pil_img
+    preview = pil_img.copy()
+    preview.thumbnail((max_side, max_side))
+    return preview
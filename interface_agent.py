@@ -1,16 +1,19 @@
+import os
 import uuid
-import io
 import hashlib
 import json
+import threading
+from collections import deque
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
 import pandas as pd
 import streamlit as st
-from PIL import Image
+from PIL import Image, ImageDraw
 import av
 
 from streamlit_webrtc import webrtc_streamer, VideoProcessorBase, RTCConfiguration
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # --- your own modules ---
 from meta_agent import MetaAgent
@@ -19,9 +22,18 @@ from serial_number_knowledge_agent import SerialNumberKnowledgeAgent
 from manual_serial_entry_agent import ManualSerialEntryAgent
 from damage_detection_agent import DamageDetectionAgent
 from scanner_agent import ScannerAgent
+from scan_scheduler import get_scheduler, SchedulerBusy
+from rate_limiter import get_rate_limiter
+from scan_client import RemoteScanAgent, scan_worker_url, ocr_endpoints
+from agent_runtime import warm_up_in_background
 
 # CSV persistence helpers
-from persistence import save_image, append_result, read_results
+from persistence import save_image, append_result, read_results, thumbnail_data_uri
+from image_ingest import decode_upload, decode_full, make_preview
+from results_export import export_to_file, columnar_available, FORMATS as EXPORT_FORMATS
+from session_images import get_image_store, ImageRef, FrameReleased
+from capture_queue import get_capture_queue
+from duplicate_index import get_duplicate_index
 
 
 # ===================== Page setup =====================
@@ -69,7 +81,10 @@ def start_new_case(trigger: str, *, task_key: str, agent_name: str, input_type:
         "meta": json.dumps(meta, ensure_ascii=False) if meta else None,
         # timeline columns (all go into Saved Results)
         "ts_camera_start": None,
+        "ts_warmup_started": None,       # background warm-up (connections / clients / indexes)
+        "ts_warmup_done": None,
         "ts_scan_pressed": None,
+        "ts_scan_started": None,         # stamped by the scan scheduler (left the queue)
         "ts_ocr_result": None,           # stamped inside agent (OCR API returns)
         "ts_gpt_result": None,           # stamped inside agent (GPT extract returns)
         "ts_gpt_verification": None,     # stamped inside agent (GPT verify returns)
@@ -98,6 +113,13 @@ def stamp(field: str, *, task_key: str, agent_name: str, input_type: str):
 
 init_case_state()
 
+image_store = get_image_store()
+capture_queue = get_capture_queue()
+capture_queue.ensure_worker()  # drains captures queued while OCR/OpenAI were unreachable
+duplicates = get_duplicate_index()
+_ctx = get_script_run_ctx()
+session_id = _ctx.session_id if _ctx is not None else None
+
 # --- Stable Experiment ID ---
 if "experiment_id" not in st.session_state:
     st.session_state.experiment_id = str(uuid.uuid4())[:8]
@@ -107,10 +129,48 @@ with st.sidebar:
     st.header("Experiment")
     st.text_input("Experiment ID", key="experiment_id")
     autosave = st.toggle("Auto-save results", value=True)
+    skip_duplicates = st.toggle(
+        "Skip duplicates on auto-save", value=False,
+        help="Don't auto-save a serial already recorded in this experiment (or anywhere in the last minutes).",
+    )
     notes = st.text_area("Notes (optional)")
     if st.button("🔁 New random ID"):
         st.session_state.experiment_id = str(uuid.uuid4())[:8]
 
+    if scan_worker_url():
+        st.caption(f"Scans run on worker service {scan_worker_url()}")
+    else:
+        # process-wide scan load (shared by all operators on this server)
+        sched = get_scheduler().metrics()
+        st.caption(
+            f"Scan load: {sched['running']}/{sched['max_workers']} running · {sched['queued']} queued · "
+            f"p95 wait {sched['wait_p95_ms'] / 1000:.1f}s"
+        )
+        if sched["queued"] >= sched["max_queue"] * 0.75:
+            st.warning("⏳ Server is busy - scans may take longer than usual.")
+        limiter = get_rate_limiter().metrics()
+        st.caption(
+            f"OpenAI limiter: {limiter['waiting']} waiting · p95 wait {limiter['wait_p95_ms'] / 1000:.1f}s · "
+            f"{limiter['throttled']} rate-limit pause(s)"
+        )
+        if limiter["paused_s"] > 0:
+            st.warning(f"⏳ OpenAI rate limit reached - vision calls resume in {limiter['paused_s']:.0f}s.")
+
+    usage = image_store.session_usage(session_id)
+    store_stats = image_store.stats()
+    st.caption(
+        f"Session images: {usage['images']} · {usage['memory_bytes'] / 2**20:.1f} MB in memory · "
+        f"{usage['disk_bytes'] / 2**20:.1f} MB spilled "
+        f"(server: {store_stats['memory_bytes'] / 2**20:.0f}/{store_stats['budget_bytes'] / 2**20:.0f} MB)"
+    )
+
+    queued = capture_queue.pending()
+    down = capture_queue.backends_down()
+    if down:
+        st.warning(f"📥 Offline ({', '.join(down)} unreachable) - captures are queued and processed later.")
+    if queued:
+        st.caption(f"Offline queue: {queued} capture(s) waiting for backfill")
+
 
 # ===================== Meta agent / tasks =====================
 meta_agent = MetaAgent()
@@ -144,24 +204,44 @@ rtc_config = RTCConfiguration(
 )
 
 
+CONSENSUS_FRAMES = int(os.getenv("CONSENSUS_FRAMES", "5"))
+
+
 class VideoProcessor(VideoProcessorBase):
     def __init__(self):
         self.frame = None
+        self._recent = deque(maxlen=CONSENSUS_FRAMES)  # last K frames for consensus scans
+        self._lock = threading.Lock()                  # recv() runs on the WebRTC worker thread
 
     def recv(self, frame):
         img = frame.to_ndarray(format="bgr24")
         self.frame = img
+        with self._lock:
+            self._recent.append(img)
         return av.VideoFrame.from_ndarray(img, format="bgr24")
 
+    def recent_frames(self):
+        """Last K frames (BGR arrays), oldest first."""
+        with self._lock:
+            return list(self._recent)
+
 
 # ===================== Helper =====================
-def _maybe_save(*, pil_img, serial_number, conf, input_type, agent_name, task_key, force=False, source_note=None):
+def _case_columns(case):
+    """Columns a case contributes to its saved row(s): ts_* timeline + usage_* accounting."""
+    return {k: v for k, v in (case or {}).items() if k.startswith(("ts_", "usage_"))}
+
+
+def _maybe_save(*, pil_img, serial_number, conf, input_type, agent_name, task_key, force=False, source_note=None,
+                extra=None):
     """
     Save ONE row to Saved Results.
-    Also merges timeline stamps from the current test case into that row.
+    Also merges timeline stamps (and usage counters) from the current test case into that row.
+    `extra` adds task-specific columns (e.g. damage detections).
+    Returns the saved row (None if nothing was saved).
     """
     if not force and not autosave:
-        return
+        return None
 
     stamp("ts_result_saved", task_key=task_key, agent_name=agent_name, input_type=input_type)
 
@@ -180,14 +260,65 @@ def _maybe_save(*, pil_img, serial_number, conf, input_type, agent_name, task_ke
         "notes": (notes.strip() if notes else None) or source_note,
     }
 
-    timeline_cols = {}
-    if st.session_state.current_case:
-        timeline_cols = {k: v for k, v in st.session_state.current_case.items() if k.startswith("ts_")}
-
-    append_result({**base_row, **timeline_cols})
+    row = {**base_row, **(extra or {}), **_case_columns(st.session_state.current_case)}
+    append_result(row)
     st.success("✅ Result saved")
 
     st.session_state.current_case = None
+    return row
+
+
+def _find_duplicate(serial_number):
+    return duplicates.find(serial_number, st.session_state.get("experiment_id", ""))
+
+
+def _duplicate_text(dup):
+    at = datetime.fromtimestamp(dup["saved_at"], VIENNA).strftime("%H:%M")
+    where = "in this experiment" if dup["same_experiment"] else f"in experiment {dup['experiment_id']}"
+    return f"🔁 `{dup['serial_number']}` already recorded at {at} by case {dup['case_id']} ({where})."
+
+
+def _save_candidates(*, pil_img, candidates, input_type, agent_name, task_key, source_note, bbox_scale=1.0):
+    """
+    Multi-label save: one row per serial candidate, all linked to the same image and case.
+    """
+    stamp("ts_result_saved", task_key=task_key, agent_name=agent_name, input_type=input_type)
+
+    exp_id = st.session_state.get("experiment_id", "")
+    img_path = save_image(pil_img) if pil_img is not None else None
+    case = st.session_state.current_case or {}
+    case_cols = _case_columns(case)
+
+    for i, c in enumerate(candidates):
+        append_result({
+            "experiment_id": exp_id,
+            "case_id": case.get("case_id"),
+            "task": task_key,
+            "agent": agent_name,
+            "input_type": input_type,
+            "serial_number": c["serial_number"],
+            "confidence": float(c["confidence"]),
+            "image_path": img_path,
+            "notes": (notes.strip() if notes else None) or source_note,
+            "label_index": i,
+            "bbox": json.dumps([round(v * bbox_scale) for v in c["bbox"]]),
+            **case_cols,
+        })
+    st.success(f"✅ Saved {len(candidates)} result(s)")
+
+    st.session_state.current_case = None
+
+
+def _draw_candidates(ref, candidates):
+    """Candidate boxes (scan-image coords) drawn on the in-memory preview."""
+    img = ref.preview.convert("RGB").copy()
+    draw = ImageDraw.Draw(img)
+    scale = img.width / ref.size[0]
+    for i, c in enumerate(candidates):
+        x0, y0, x1, y1 = (v * scale for v in c["bbox"])
+        draw.rectangle((x0, y0, x1, y1), outline=(255, 64, 64), width=2)
+        draw.text((x0 + 2, y0 + 2), str(i + 1), fill=(255, 64, 64))
+    return img
 
 
 # ===================== Serial Number UI =====================
@@ -221,16 +352,31 @@ def serial_number_interface(sn_agent, agent_name: str):
     st.subheader(f"{agent_name.replace('Agent','')} Inspection")
 
     auto_save_mode = bool(getattr(sn_agent, "is_auto_save", False))
+    _warm_on_select(sn_agent, agent_name)
     mode = st.radio("Input", ["📷 Live Camera", "📁 Upload Image"], key=f"{agent_name}_mode")
     input_type = "camera" if mode == "📷 Live Camera" else "upload"
 
     # --- State init ---
+    # sn_image holds an ImageRef (small preview + key into the process-wide image store)
     for key in ["sn_detected_serial", "sn_conf", "sn_image", "sn_edit_mode", "sn_edit_value", "sn_last_upload_hash"]:
         st.session_state.setdefault(key, None if "edit_mode" not in key else False)
     st.session_state.setdefault("sn_is_known_good", False)
     st.session_state.setdefault("sn_source", None)
+    st.session_state.setdefault("sn_upload_decoded", None)  # (hash, ImageRef) of the current upload across reruns
+    st.session_state.setdefault("sn_candidates", None)      # multi-label mode results
+
+    multi_mode = hasattr(sn_agent, "scan_multi") and st.toggle(
+        "🏷️ Multi-label (read all plates)", key=f"{agent_name}_multi",
+        help="Find every data plate (P/N, SER, MOD, ...) in one capture and save each as its own row.",
+    )
+
+    def _release_image(ref):
+        cached = st.session_state.sn_upload_decoded
+        if ref is not None and not (cached and cached[1] is ref):  # the upload ref lives as long as the upload
+            image_store.release(ref)
 
     def _clear_sn_state():
+        _release_image(st.session_state.sn_image)
         st.session_state.sn_detected_serial = None
         st.session_state.sn_conf = None
         st.session_state.sn_image = None
@@ -238,20 +384,36 @@ def serial_number_interface(sn_agent, agent_name: str):
         st.session_state.sn_edit_value = ""
         st.session_state.sn_is_known_good = False
         st.session_state.sn_source = None
+        st.session_state.sn_candidates = None
 
-    def _sn_set_result(pil_img, serial_number, conf, *, is_known_good=False, source=None):
-        st.session_state.sn_image = pil_img
+    def _sn_set_result(image, serial_number, conf, *, is_known_good=False, source=None):
+        ref = image if isinstance(image, ImageRef) else image_store.put(image, session_id)
+        if st.session_state.sn_image is not ref:
+            _release_image(st.session_state.sn_image)
+        st.session_state.sn_image = ref
         st.session_state.sn_detected_serial = serial_number
         st.session_state.sn_conf = conf
         st.session_state.sn_edit_value = serial_number or ""
         st.session_state.sn_edit_mode = False
         st.session_state.sn_is_known_good = bool(is_known_good)
         st.session_state.sn_source = source
+        st.session_state.sn_candidates = None
+
+    def _sn_load_full(ref):
+        """Full frame of the kept capture; an expired / released one asks for a rescan instead of failing."""
+        try:
+            return image_store.load_full(ref)
+        except FrameReleased:
+            st.warning("⌛ This capture is no longer available - please rescan.")
+            _clear_sn_state()
+            st.session_state.sn_last_upload_hash = None
+            st.session_state.sn_upload_decoded = None
+            st.stop()
 
     def _sn_save(serial_value, edited=False, note_override=None):
         source_note = note_override or ("scanner-edited" if edited else "scanner-auto")
         _maybe_save(
-            pil_img=st.session_state.sn_image,
+            pil_img=_sn_load_full(st.session_state.sn_image),
             serial_number=serial_value,
             conf=st.session_state.sn_conf,
             input_type=input_type,
@@ -261,6 +423,108 @@ def serial_number_interface(sn_agent, agent_name: str):
             source_note=source_note,
         )
 
+    def _sn_save_candidates(candidates, note):
+        ref = st.session_state.sn_image
+        full_img = _sn_load_full(ref)
+        _save_candidates(
+            pil_img=full_img,
+            candidates=candidates,
+            input_type=input_type,
+            agent_name=agent_name,
+            task_key=task_type,
+            source_note=note,
+            bbox_scale=full_img.width / ref.size[0],  # boxes refer to the (reduced) scan image
+        )
+
+    def _sn_skip_if_duplicate(serial_number):
+        """Auto-save paths: don't record the same serial twice (sidebar toggle)."""
+        dup = _find_duplicate(serial_number)
+        if dup and skip_duplicates:
+            st.info(f"{_duplicate_text(dup)} Not saved again.")
+            _clear_sn_state()
+            st.session_state.current_case = None
+            st.stop()
+
+    def _sn_queue_offline(image, backends):
+        """Backends unreachable: save the capture as a "queued" row now, scan + backfill it later."""
+        pil_img = _sn_load_full(image) if isinstance(image, ImageRef) else image
+        row = _maybe_save(
+            pil_img=pil_img,
+            serial_number=None,
+            conf=None,
+            input_type=input_type,
+            agent_name=agent_name,
+            task_key=task_type,
+            force=True,
+            source_note="queued-offline",
+            extra={"scan_status": "queued"},
+        )
+        capture_queue.enqueue(row)
+        st.info(f"📥 {', '.join(backends)} unreachable - capture queued, the result will be backfilled.")
+
+    def _sn_scan(pil_img, image=None, frames=None):
+        """
+        Single-label scan. While a backend is known to be down the capture is queued
+        without scanning (operators keep going); an outage seen during the scan queues it too.
+        With frames (camera consensus mode) the last K frames are OCR'd and voted; pil_img is the newest.
+        """
+        down = capture_queue.backends_down()
+        result = None, None
+        if frames and st.session_state.current_case is not None:
+            st.session_state.current_case.pop("consensus_frame", None)  # set again by this scan
+        if not down:
+            try:
+                with st.spinner("🔍 Analyzing image..."):
+                    result = sn_agent.scan_consensus(frames) if frames else sn_agent.scan(pil_img)
+            except SchedulerBusy as e:
+                st.warning(f"⏳ {e}")
+                st.session_state.sn_last_upload_hash = None  # not scanned: an upload is retried on the next run
+                st.stop()
+            backend = (st.session_state.current_case or {}).get("backend_unavailable")
+            if backend:
+                capture_queue.mark_down(backend)
+                down = [backend]
+        if down:
+            _sn_queue_offline(image or pil_img, down)
+            st.stop()
+        return result
+
+    def _sn_scan_multi(pil_img, image=None):
+        try:
+            with st.spinner("🔍 Reading all labels..."):
+                candidates = sn_agent.scan_multi(pil_img)
+        except SchedulerBusy as e:
+            st.warning(f"⏳ {e}")
+            return
+
+        backend = (st.session_state.current_case or {}).get("backend_unavailable")
+        if backend:
+            capture_queue.mark_down(backend)
+            st.warning(f"📥 {backend} unreachable - multi-label captures are not queued, please rescan later.")
+
+        if not candidates:
+            st.warning("No serial number detected.")
+            return
+
+        if auto_save_mode and skip_duplicates:
+            fresh = [c for c in candidates if not _find_duplicate(c["serial_number"])]
+            if not fresh:
+                st.info(f"🔁 All {len(candidates)} label(s) already recorded - nothing saved.")
+                st.session_state.current_case = None
+                st.stop()
+            candidates = fresh
+
+        _sn_set_result(image or pil_img, None, None)
+        st.session_state.sn_candidates = candidates
+
+        if auto_save_mode:
+            _sn_save_candidates(candidates, "scanner-auto-multi")
+            st.success(f"✅ Auto-saved {len(candidates)} label(s) (Scanner mode).")
+            _clear_sn_state()
+            st.stop()
+
+        st.success(f"Detected {len(candidates)} label(s).")
+
     # ===================== CAMERA =====================
     if mode == "📷 Live Camera":
         col_cam, col_side = st.columns([1, 2], vertical_alignment="top")
@@ -284,11 +548,16 @@ def serial_number_interface(sn_agent, agent_name: str):
             if is_playing and not was_playing:
                 start_new_case(trigger="camera_start", task_key=task_type, agent_name=agent_name, input_type=input_type)
                 stamp("ts_camera_start", task_key=task_type, agent_name=agent_name, input_type=input_type)
+                warm_up_in_background(sn_agent, case=st.session_state.current_case)  # recorded in this case
 
             st.session_state.webrtc_was_playing = is_playing
 
         with col_side:
             st.caption("Scan / Output")
+            consensus_mode = not multi_mode and hasattr(sn_agent, "scan_consensus") and st.toggle(
+                "🗳️ Multi-frame consensus", value=False, key=f"{agent_name}_consensus",
+                help=f"OCR the last {CONSENSUS_FRAMES} frames at once and vote; GPT only runs if they disagree.",
+            )
             scan_clicked = st.button("📸 Scan", use_container_width=False)
 
             if scan_clicked:
@@ -302,16 +571,25 @@ def serial_number_interface(sn_agent, agent_name: str):
                 else:
                     pil_img = Image.fromarray(frame[..., ::-1])  # BGR -> RGB
 
-                    with st.spinner("🔍 Analyzing image..."):
-                        result = sn_agent.scan(pil_img)
-
-                    serial_number, conf, is_known_good, source = _unpack_agent_result(result)
+                    if multi_mode:
+                        _sn_scan_multi(pil_img)
+                        serial_number = conf = None
+                    else:
+                        frames = None
+                        if consensus_mode:
+                            frames = [Image.fromarray(f[..., ::-1]) for f in ctx.video_processor.recent_frames()]
+                            pil_img = frames[-1] if frames else pil_img
+                        result = _sn_scan(pil_img, frames=frames)
+                        serial_number, conf, is_known_good, source = _unpack_agent_result(result)
+                        if frames:  # keep the frame the consensus result was read from
+                            pil_img = frames[(st.session_state.current_case or {}).get("consensus_frame", -1)]
 
                     if serial_number:
                         _sn_set_result(pil_img, serial_number, conf, is_known_good=is_known_good, source=source)
 
                         # Scanner mode: always auto-save
                         if auto_save_mode:
+                            _sn_skip_if_duplicate(serial_number)
                             _sn_save(serial_number, edited=False, note_override="scanner-auto")
                             st.success("✅ Auto-saved (Scanner mode).")
                             _clear_sn_state()
@@ -319,17 +597,18 @@ def serial_number_interface(sn_agent, agent_name: str):
 
                         # Knowledge mode: auto-save ONLY if knowledge match
                         if is_known_good:
+                            _sn_skip_if_duplicate(serial_number)
                             _sn_save(serial_number, edited=False, note_override=f"knowledge-auto:{source}")
                             st.success(f"✅ Found in KnowledgeAgent ({source}) → saved automatically.")
                             _clear_sn_state()
                             st.stop()
 
                         st.success("Detected a serial number.")
-                    else:
+                    elif not multi_mode:
                         st.warning("No serial number detected.")
 
             if st.session_state.sn_image is not None:
-                st.image(st.session_state.sn_image, caption="Last captured frame", width=240)
+                st.image(st.session_state.sn_image.preview, caption="Last captured frame", width=240)
 
     # ===================== UPLOAD =====================
     else:
@@ -337,8 +616,18 @@ def serial_number_interface(sn_agent, agent_name: str):
         if uploaded_img:
             raw = uploaded_img.getvalue()
             current_hash = hashlib.md5(raw).hexdigest()
-            pil_img = Image.open(io.BytesIO(raw))
-            st.image(pil_img, caption="🖼️ Uploaded Image", use_container_width=True)
+
+            # decode once per upload (reduced scale + EXIF orientation), reuse on reruns;
+            # session state only keeps the ref, the frame itself lives in the image store
+            cached = st.session_state.sn_upload_decoded
+            if cached is None or cached[0] != current_hash or not image_store.alive(cached[1]):
+                old_ref = cached[1] if cached else None
+                cached = (current_hash, image_store.put(decode_upload(raw), session_id, raw=raw))
+                st.session_state.sn_upload_decoded = cached
+                if old_ref is not None and old_ref is not st.session_state.sn_image:
+                    image_store.release(old_ref)
+            upload_ref = cached[1]
+            st.image(upload_ref.preview, caption="🖼️ Uploaded Image", width=480)
 
             if st.session_state.sn_last_upload_hash != current_hash:
                 start_new_case(
@@ -349,32 +638,38 @@ def serial_number_interface(sn_agent, agent_name: str):
                     bytes=len(raw),
                 )
 
-                with st.spinner("🔍 Analyzing image..."):
-                    result = sn_agent.scan(pil_img)
+                # mark the upload as handled first: auto-save / queueing stop the script run early
+                st.session_state.sn_last_upload_hash = current_hash
 
-                serial_number, conf, is_known_good, source = _unpack_agent_result(result)
+                pil_img = image_store.load(upload_ref)
+                if multi_mode:
+                    _sn_scan_multi(pil_img, image=upload_ref)
+                    serial_number = conf = None
+                else:
+                    result = _sn_scan(pil_img, image=upload_ref)
+                    serial_number, conf, is_known_good, source = _unpack_agent_result(result)
 
                 if serial_number:
-                    _sn_set_result(pil_img, serial_number, conf, is_known_good=is_known_good, source=source)
+                    _sn_set_result(upload_ref, serial_number, conf, is_known_good=is_known_good, source=source)
 
                     if auto_save_mode:
+                        _sn_skip_if_duplicate(serial_number)
                         _sn_save(serial_number, edited=False, note_override="scanner-auto")
                         st.success("✅ Auto-saved (Scanner mode).")
                         _clear_sn_state()
                         st.stop()
 
                     if is_known_good:
+                        _sn_skip_if_duplicate(serial_number)
                         _sn_save(serial_number, edited=False, note_override=f"knowledge-auto:{source}")
                         st.success(f"✅ Found in KnowledgeAgent ({source}) → saved automatically.")
                         _clear_sn_state()
                         st.stop()
 
                     st.success("Detected a serial number.")
-                else:
+                elif not multi_mode:
                     st.warning("No serial number detected.")
 
-                st.session_state.sn_last_upload_hash = current_hash
-
     # ===================== REVIEW / SAVE =====================
     if auto_save_mode:
         st.divider()
@@ -386,10 +681,31 @@ def serial_number_interface(sn_agent, agent_name: str):
 
     detected = st.session_state.sn_detected_serial
     conf = st.session_state.sn_conf
+    candidates = st.session_state.sn_candidates
+
+    if candidates:
+        st.image(_draw_candidates(st.session_state.sn_image, candidates), caption="Detected labels", width=480)
+        selected = []
+        for i, c in enumerate(candidates):
+            known = " · ✅ known" if c.get("is_known_good") else ""
+            dup = _find_duplicate(c["serial_number"])
+            if dup:
+                known += f" · 🔁 recorded {datetime.fromtimestamp(dup['saved_at'], VIENNA):%H:%M} by case {dup['case_id']}"
+            label = f"{i + 1}. `{c['serial_number']}` (conf {c['confidence']:.3f}{known})"
+            if st.checkbox(label, value=not dup, key=f"sn_candidate_{i}_{c['serial_number']}"):
+                selected.append(c)
+
+        if st.button("✅ Save selected labels", disabled=not selected):
+            stamp("ts_accept_save_pressed", task_key=task_type, agent_name=agent_name, input_type=input_type)
+            _sn_save_candidates(selected, "manual-accept-multi")
+            _clear_sn_state()
 
-    if detected:
+    elif detected:
         st.markdown("**Detected Serial Number**")
         st.code(detected)
+        dup = _find_duplicate(detected)
+        if dup:
+            st.warning(_duplicate_text(dup))
 
         if conf is not None:
             try:
@@ -422,19 +738,55 @@ def serial_number_interface(sn_agent, agent_name: str):
 
 
 # ===================== Agent Selection =====================
+def _scan_agent(agent_cls):
+    """In-process agent, or its thin client when scans run on a worker service (SCAN_WORKER_URL)."""
+    return RemoteScanAgent(agent_cls.__name__) if scan_worker_url() else agent_cls(**ocr_endpoints())
+
+
+def _warm_on_select(agent, agent_name: str):
+    """Warm the agent up in the background once the task is selected (not on every rerun)."""
+    if st.session_state.get("warmed_agent") != agent_name:
+        st.session_state.warmed_agent = agent_name
+        warm_up_in_background(agent)
+
+
 if selected_agent == "SerialNumberAgent":
-    serial_number_interface(SerialNumberAgent(), "SerialNumberAgent")
+    serial_number_interface(_scan_agent(SerialNumberAgent), "SerialNumberAgent")
 
 elif selected_agent == "SerialNumberKnowledgeAgent":
-    serial_number_interface(SerialNumberKnowledgeAgent(), "SerialNumberKnowledgeAgent")
+    serial_number_interface(_scan_agent(SerialNumberKnowledgeAgent), "SerialNumberKnowledgeAgent")
 
 elif selected_agent == "ScannerAgent":
-    serial_number_interface(ScannerAgent(), "ScannerAgent")
+    serial_number_interface(_scan_agent(ScannerAgent), "ScannerAgent")
 
 elif selected_agent == "ManualSerialEntryAgent":
     st.subheader("Manual Serial Entry")
     manual_agent = ManualSerialEntryAgent()
-    manual_sn = st.text_input("Serial Number", placeholder="e.g., ABC1234567")
+
+    def _pick_suggestion(value):
+        st.session_state.manual_sn = value
+
+    manual_sn = st.text_input("Serial Number", placeholder="e.g., ABC1234567", key="manual_sn")
+
+    # type-ahead from known + previously saved serials
+    suggestions = manual_agent.suggest(manual_sn) if manual_sn and manual_sn.strip() else []
+    match = manual_agent.lookup(manual_sn) if manual_sn else None
+    if match:
+        st.caption(f"✅ Matches a {'known' if match[1] == 'known' else 'previously saved'} serial: `{match[0]}`")
+    elif manual_sn and manual_sn.strip():
+        st.caption("⚠️ Not a known or previously saved serial - please double-check.")
+    dup = _find_duplicate(manual_sn) if manual_sn else None
+    if dup:
+        st.warning(_duplicate_text(dup))
+    if suggestions and not match:
+        sug_cols = st.columns(4)
+        for i, (sug, source) in enumerate(suggestions):
+            sug_cols[i % 4].button(
+                f"{'⭐ ' if source == 'known' else ''}{sug}",
+                key=f"manual_sug_{i}",
+                on_click=_pick_suggestion,
+                args=(sug,),
+            )
 
     if st.button("💾 Save Manual Entry"):
         start_new_case(trigger="manual_entry", task_key=task_type, agent_name="ManualSerialEntryAgent", input_type="manual")
@@ -455,13 +807,72 @@ elif selected_agent == "ManualSerialEntryAgent":
 elif selected_agent == "DamageDetectionAgent":
     st.subheader("Damage Detection")
     dd_agent = DamageDetectionAgent()
-    st.info(dd_agent.get_status())
+    _warm_on_select(dd_agent, "DamageDetectionAgent")
+    st.caption(dd_agent.get_status())
+    st.session_state.setdefault("dd_result", None)  # (hash, detections, full-res width)
+
+    def _dd_save(pil_img, detections, *, force, note):
+        _maybe_save(
+            pil_img=pil_img,
+            serial_number=None,
+            conf=max((d["score"] for d in detections), default=0.0),
+            input_type="upload",
+            agent_name="DamageDetectionAgent",
+            task_key=task_type,
+            force=force,
+            source_note=note,
+            extra={"damage_count": len(detections), "damage_boxes": json.dumps(detections)},
+        )
+
+    uploaded_img = st.file_uploader("Upload a panel photo", type=["jpg", "jpeg", "png"], key="dd_upload")
+    if uploaded_img:
+        raw = uploaded_img.getvalue()
+        current_hash = hashlib.md5(raw).hexdigest()
+        preview_img = make_preview(decode_upload(raw))
+
+        if st.button("🔍 Detect damage"):
+            start_new_case(trigger="damage_detect", task_key=task_type, agent_name="DamageDetectionAgent",
+                           input_type="upload", bytes=len(raw))
+            stamp("ts_scan_pressed", task_key=task_type, agent_name="DamageDetectionAgent", input_type="upload")
+            dd_img = decode_full(raw)  # tiles need the full resolution
+            try:
+                with st.spinner("🔍 Scanning panel tiles..."):
+                    detections = dd_agent.detect(dd_img)
+            except SchedulerBusy as e:
+                st.warning(f"⏳ {e}")
+                st.session_state.current_case = None
+                st.stop()
+            stamp("ts_detection_result", task_key=task_type, agent_name="DamageDetectionAgent", input_type="upload")
+            st.session_state.dd_result = (current_hash, detections, dd_img.width)
+            _dd_save(dd_img, detections, force=False, note="damage-auto")
+
+        result = st.session_state.dd_result
+        if result and result[0] == current_hash:
+            _, detections, full_width = result
+            overlay = preview_img.convert("RGB").copy()
+            draw = ImageDraw.Draw(overlay)
+            scale = overlay.width / full_width
+            for d in detections:
+                draw.rectangle([v * scale for v in d["bbox"]], outline=(255, 64, 64), width=3)
+            st.image(overlay, caption=f"{len(detections)} damage candidate(s)", use_container_width=True)
+
+            if detections:
+                st.dataframe(pd.DataFrame(detections), use_container_width=True)
+            else:
+                st.success("No damage candidates found.")
+
+            if not autosave and st.session_state.current_case is not None and st.button("💾 Save result"):
+                _dd_save(decode_full(raw), detections, force=True, note="damage-manual")
+        else:
+            st.image(preview_img, caption="🖼️ Uploaded Image", use_container_width=True)
 
 
 # ===================== Results Viewer =====================
 st.divider()
 st.subheader("Saved Results")
 
+RESULTS_PAGE_SIZE = 200
+
 rows = read_results()
 if rows:
     df = pd.DataFrame(rows)
@@ -475,7 +886,10 @@ if rows:
         "serial_number",
         "confidence",
         "ts_camera_start",
+        "ts_warmup_started",
+        "ts_warmup_done",
         "ts_scan_pressed",
+        "ts_scan_started",
         "ts_ocr_result",
         "ts_gpt_result",
         "ts_gpt_verification",
@@ -483,6 +897,7 @@ if rows:
         "ts_edit_pressed",
         "ts_save_edited_pressed",
         "ts_result_saved",
+        "usage_cost_usd",
         "image_path",
         "notes",
         "timestamp_iso",
@@ -490,12 +905,65 @@ if rows:
     cols = [c for c in preferred if c in df.columns] + [c for c in df.columns if c not in preferred]
     df = df[cols]
 
-    st.dataframe(df, use_container_width=True)
-    st.download_button(
-        "⬇️ Download CSV",
-        data=df.to_csv(index=False).encode("utf-8"),
-        file_name="experiments.csv",
-        mime="text/csv",
+    # one page at a time (most recent page first); thumbnails are embedded for the shown rows only
+    pages = max(1, -(-len(df) // RESULTS_PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages}, {len(df)} rows)", min_value=1, max_value=pages, value=pages,
+                           key="results_page") if pages > 1 else 1
+    page_df = df.iloc[(page - 1) * RESULTS_PAGE_SIZE: page * RESULTS_PAGE_SIZE].copy()
+    if "image_path" in page_df.columns:
+        page_df.insert(0, "thumbnail", page_df["image_path"].map(thumbnail_data_uri))
+
+    st.dataframe(
+        page_df,
+        use_container_width=True,
+        column_config={"thumbnail": st.column_config.ImageColumn("Image", width="small")},
     )
+
+    # vision spend per experiment; usage is per case (multi-label rows share one case)
+    usage_cols = [c for c in df.columns if c.startswith("usage_")]
+    if usage_cols:
+        with st.expander("💰 Vision usage & estimated cost"):
+            usage = df[["experiment_id", "case_id", "agent", "task", "input_type"] + usage_cols].copy()
+            usage[usage_cols] = usage[usage_cols].apply(pd.to_numeric, errors="coerce").fillna(0)
+            usage = usage[usage[usage_cols].gt(0).any(axis=1)].drop_duplicates("case_id")
+            summary = (
+                usage.groupby(["experiment_id", "agent", "task", "input_type"])
+                .agg(cases=("case_id", "size"), **{c: (c, "sum") for c in usage_cols})
+                .reset_index()
+            )
+            if "usage_cost_usd" in summary.columns:  # absent while every scan was OCR-only / cache hits
+                summary["cost_per_case_usd"] = summary["usage_cost_usd"] / summary["cases"]
+            st.dataframe(summary, use_container_width=True, hide_index=True)
+
+    # exports are generated only on demand (streamed from experiments.csv, not from df)
+    with st.expander("⬇️ Export results"):
+        formats = ["CSV"] + (["Parquet", "Arrow IPC"] if columnar_available() else [])
+        exp_ids = sorted({r.get("experiment_id", "") for r in rows} - {""})
+        col_f, col_e = st.columns([1, 1])
+        export_fmt = col_f.radio("Format", formats, horizontal=True, key="export_fmt")
+        export_exp = col_e.selectbox("Experiment", ["(all)"] + exp_ids, key="export_exp")
+
+        if st.button("📦 Prepare export"):
+            previous = st.session_state.get("export_file")
+            if previous and os.path.exists(previous[0]):
+                os.remove(previous[0])
+            exp_filter = None if export_exp == "(all)" else export_exp
+            with st.spinner("Writing export..."):
+                path = export_to_file(export_fmt, exp_filter)
+            ext, mime = EXPORT_FORMATS[export_fmt]
+            st.session_state.export_file = (path, f"experiments_{exp_filter or 'all'}{ext}", mime)
+
+        def _discard_export():
+            """The download is served from memory - the temp file is no longer needed."""
+            served = st.session_state.pop("export_file", None)
+            if served and os.path.exists(served[0]):
+                os.remove(served[0])
+
+        export_file = st.session_state.get("export_file")
+        if export_file and os.path.exists(export_file[0]):
+            path, file_name, mime = export_file
+            with open(path, "rb") as f:
+                st.download_button(f"⬇️ Download {file_name}", data=f.read(), file_name=file_name, mime=mime,
+                                   on_click=_discard_export)
 else:
     st.info("No results saved yet.")
@@ -0,0 +1,173 @@
+# label_regions.py
+import numpy as np
+from PIL import Image
+
+WORK_WIDTH = 640        # region proposal runs on a downscaled grayscale copy
+EDGE_THRESHOLD = 40     # horizontal gradient that counts as a character stroke
+WINDOW = (9, 25)        # (rows, cols) neighbourhood that merges strokes into words/lines
+MIN_DENSITY = 0.08      # stroke density of text; a thin line stays below, thicker plate borders don't
+MIN_GAP_FRAC = 0.02     # empty space needed to split two regions
+MIN_AREA_FRAC = 0.004   # ignore specks
+MAX_ASPECT = 2.5        # height / width; label text runs horizontally, plate borders are tall and thin
+MIN_COLUMN_FILL = 0.3   # share of a region's columns with strokes; a border edge fills only a couple
+MAX_DEPTH = 6
+
+
+def _local_density(mask: np.ndarray, ky: int, kx: int) -> np.ndarray:
+    """Fraction of set pixels in a ky x kx box around each pixel, via an integral image."""
+    h, w = mask.shape
+    integral = np.zeros((h + 1, w + 1), dtype=np.int32)
+    integral[1:, 1:] = mask.cumsum(axis=0).cumsum(axis=1)
+
+    ry, rx = ky // 2, kx // 2
+    y0 = np.clip(np.arange(h) - ry, 0, h)[:, None]
+    y1 = np.clip(np.arange(h) + ry + 1, 0, h)[:, None]
+    x0 = np.clip(np.arange(w) - rx, 0, w)[None, :]
+    x1 = np.clip(np.arange(w) + rx + 1, 0, w)[None, :]
+    window = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+    return window / ((y1 - y0) * (x1 - x0))
+
+
+def _runs(profile: np.ndarray, min_gap: int):
+    """(start, end) segments where profile > 0; gaps shorter than min_gap are bridged."""
+    on = np.flatnonzero(profile > 0)
+    if on.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(on) > min_gap)
+    starts = np.concatenate(([on[0]], on[breaks + 1]))
+    ends = np.concatenate((on[breaks], [on[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _xy_cut(mask, y0, y1, x0, x1, min_gap, depth, out):
+    sub = mask[y0:y1, x0:x1]
+    rows = _runs(sub.sum(axis=1), min_gap)
+    if not rows:
+        return
+    # tighten to content
+    y0, y1 = y0 + rows[0][0], y0 + rows[-1][1]
+    sub = mask[y0:y1, x0:x1]
+    cols = _runs(sub.sum(axis=0), min_gap)
+    x0, x1 = x0 + cols[0][0], x0 + cols[-1][1]
+
+    if depth >= MAX_DEPTH or (len(rows) == 1 and len(cols) == 1):
+        out.append((y0, y1, x0, x1))
+        return
+
+    # split along the axis that actually has gaps (rows first: labels are stacked lines)
+    if len(rows) > 1:
+        base = y0 - rows[0][0]
+        for a, b in rows:
+            _xy_cut(mask, base + a, base + b, x0, x1, min_gap, depth + 1, out)
+    else:
+        base = x0 - cols[0][0]
+        for a, b in cols:
+            _xy_cut(mask, y0, y1, base + a, base + b, min_gap, depth + 1, out)
+
+
+def find_label_regions(pil_img: Image.Image, max_regions: int = 6, pad_frac: float = 0.03):
+    """
+    Propose text/label regions in a frame (classical, NumPy only).
+    Returns a list of (x0, y0, x1, y1) boxes in original pixel coordinates,
+    most text-dense first. Empty list if nothing text-like was found.
+    """
+    gray = pil_img.convert("L")
+    scale = min(1.0, WORK_WIDTH / gray.width)
+    if scale < 1.0:
+        gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))))
+
+    a = np.asarray(gray, dtype=np.int16)
+    h, w = a.shape
+    strokes = np.zeros((h, w), dtype=bool)
+    strokes[:, 1:] = np.abs(np.diff(a, axis=1)) > EDGE_THRESHOLD
+
+    mask = _local_density(strokes, *WINDOW) > MIN_DENSITY
+    min_gap = max(2, int(MIN_GAP_FRAC * max(h, w)))
+
+    leaves = []
+    _xy_cut(mask, 0, h, 0, w, min_gap, 0, leaves)
+
+    scored = []
+    for y0, y1, x0, x1 in leaves:
+        area = (y1 - y0) * (x1 - x0)
+        if area < MIN_AREA_FRAC * h * w or area >= 0.95 * h * w:
+            continue
+        region = strokes[y0:y1, x0:x1]
+        if y1 - y0 > MAX_ASPECT * (x1 - x0) or region.any(axis=0).mean() < MIN_COLUMN_FILL:
+            continue  # plate border / long straight edge, not text
+        density = region.mean()
+        scored.append((density, (y0, y1, x0, x1)))
+    scored.sort(key=lambda t: t[0], reverse=True)
+
+    boxes = []
+    pad_y, pad_x = int(pad_frac * h), int(pad_frac * w)
+    for _, (y0, y1, x0, x1) in scored[:max_regions]:
+        box = (
+            max(0, x0 - pad_x) / scale,
+            max(0, y0 - pad_y) / scale,
+            min(w, x1 + pad_x) / scale,
+            min(h, y1 + pad_y) / scale,
+        )
+        boxes.append(tuple(int(round(v)) for v in box))
+    return boxes
+
+
+def collect_candidates(boxes: list, reads: list) -> list[dict]:
+    """
+    Combine region boxes with their OCR reads into serial candidates.
+    Empty reads are dropped; duplicate serials keep the most confident box. Best first.
+    """
+    best = {}
+    for bbox, (serial, conf) in zip(boxes, reads):
+        if not serial:
+            continue
+        conf = float(conf or 0.0)
+        if serial not in best or conf > best[serial]["confidence"]:
+            best[serial] = {"serial_number": serial, "confidence": conf, "bbox": list(bbox)}
+    return sorted(best.values(), key=lambda c: c["confidence"], reverse=True)
+
+
+def serial_roi(size, serial_box, text_boxes=(), pad_frac: float = 0.6, max_area_frac: float = 0.6):
+    """
+    Padded box (x0, y0, x1, y1) around the serial text and its label, from OCR text boxes.
+    The label (SER / S/N / ESN ...) is taken from text on the same line just left of the serial
+    or right above it. Without a serial box, all text boxes are used.
+    Returns None if there is nothing to crop to or the crop would barely shrink the frame.
+    """
+    w, h = size
+    if serial_box is None:
+        if not text_boxes:
+            return None
+        boxes = list(text_boxes)
+        line_h = float(np.median([b[3] - b[1] for b in boxes]))
+    else:
+        sx0, sy0, sx1, sy1 = serial_box
+        line_h = max(1, sy1 - sy0)
+        cy = (sy0 + sy1) / 2
+        boxes = [serial_box]
+        for bx0, by0, bx1, by1 in text_boxes:
+            same_line = abs((by0 + by1) / 2 - cy) <= 0.75 * line_h and bx1 <= sx0 + 0.5 * line_h \
+                and sx0 - bx1 <= 4 * line_h
+            above = by1 <= sy0 + 0.25 * line_h and sy0 - by1 <= 1.5 * line_h and bx0 < sx1 and bx1 > sx0
+            if same_line or above:
+                boxes.append((bx0, by0, bx1, by1))
+
+    pad = max(8.0, pad_frac * line_h)
+    x0 = max(0, int(min(b[0] for b in boxes) - pad))
+    y0 = max(0, int(min(b[1] for b in boxes) - pad))
+    x1 = min(w, int(max(b[2] for b in boxes) + pad))
+    y1 = min(h, int(max(b[3] for b in boxes) + pad))
+    if x1 <= x0 or y1 <= y0 or (x1 - x0) * (y1 - y0) > max_area_frac * w * h:
+        return None
+    return x0, y0, x1, y1
+
+
+def crop_to_serial(pil_img: Image.Image, boxes) -> Image.Image:
+    """GPT-stage input: the serial ROI if OCR returned text boxes, else the full frame."""
+    if not boxes:
+        return pil_img
+    roi = serial_roi(pil_img.size, boxes.get("serial"), boxes.get("text") or ())
+    if roi is None:
+        return pil_img
+    print(f"✂️ GPT input cropped to serial ROI {roi} ({pil_img.width}x{pil_img.height} frame)")
+    return pil_img.crop(roi)
@@ -0,0 +1,337 @@
+# load_test.py
+"""
+Offline capacity test: N simulated operator sessions against stub OCR / OpenAI backends.
+
+    python load_test.py --sessions 1,4,8,16,32 --step-seconds 30 --think-ms 2000
+
+Each session behaves like a Streamlit script thread: think -> scan() -> save image + row -> repeat.
+Per concurrency step it reports sustained scans/s, latency percentiles, errors, process CPU and RSS.
+Nothing leaves the machine: backends are local stubs (in a child process, so they do not count
+towards CPU/RSS) and results are written to a temporary results/ directory.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from PIL import Image, ImageDraw
+
+AGENTS = {
+    "serial": ("serial_number_agent", "SerialNumberAgent"),
+    "knowledge": ("serial_number_knowledge_agent", "SerialNumberKnowledgeAgent"),
+    "scanner": ("scanner_agent", "ScannerAgent"),
+}
+
+
+# ===================== Stub backends (child process) =====================
+def _serve_stubs(conn, ocr_ms, gpt_ms, early_accept_rate, serial, port=0):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path.startswith("/scan_serial"):
+                time.sleep(random.uniform(0.5, 1.5) * ocr_ms / 1000)
+                conf = 0.97 if random.random() < early_accept_rate else 0.70
+                self._reply({"serial_number": serial, "confidence": conf})
+            else:  # /v1/chat/completions
+                time.sleep(random.uniform(0.5, 1.5) * gpt_ms / 1000)
+                self._reply({
+                    "id": "stub", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": serial}}],
+                    "usage": {"prompt_tokens": 800, "completion_tokens": 5, "total_tokens": 805},
+                })
+
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    conn.send(server.server_address[1])
+    server.serve_forever()
+
+
+def start_stubs(ocr_ms, gpt_ms, early_accept_rate, serial="D00494", port=0):
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(
+        target=_serve_stubs, args=(child, ocr_ms, gpt_ms, early_accept_rate, serial, port), daemon=True
+    )
+    proc.start()
+    return proc, parent.recv()
+
+
+# ===================== Process metrics =====================
+def _cpu_seconds() -> float:
+    t = os.times()
+    return t.user + t.system
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak, KiB on Linux
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+# ===================== Frames =====================
+def make_frames(n: int, size=(1280, 720), image_path: str | None = None):
+    """Distinct frames (so the content-addressed image store really writes each save)."""
+    if image_path:
+        from image_ingest import decode_upload
+        with open(image_path, "rb") as f:
+            base = decode_upload(f.read())
+    else:
+        base = Image.new("RGB", size, (200, 200, 195))
+        draw = ImageDraw.Draw(base)
+        draw.rectangle((400, 250, 880, 470), outline=(20, 20, 20), width=4)
+        draw.text((440, 300), "P/N 2117-4410", fill=(20, 20, 20))
+        draw.text((440, 360), "SER D00494", fill=(20, 20, 20))
+    frames = []
+    for i in range(n):
+        frame = base.copy()
+        ImageDraw.Draw(frame).text((10, 10), f"frame {i}", fill=(90, 90, 90))
+        frames.append(frame)
+    return frames
+
+
+# ===================== Sessions =====================
+class Step:
+    def __init__(self):
+        self.scan_ms = []
+        self.save_ms = []
+        self.done_at = []   # perf_counter at scan completion (throughput window)
+        self.errors = {}
+        self.empty = 0
+        self.lock = threading.Lock()
+
+    def error(self, name):
+        with self.lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def _session(idx, agent, frames, think_s, save, stop, measure_from, step):
+    from agent_runtime import run_sync, CURRENT_SESSION
+    from persistence import save_image, append_result
+
+    session_id = f"load-{idx}"
+    rnd = random.Random(idx)
+
+    async def _scan(pil_img):
+        CURRENT_SESSION.set(session_id)  # scheduler fairness: one queue per simulated operator
+        return await agent.scan_async(pil_img)
+
+    seq = 0
+    while not stop.is_set():
+        if stop.wait(rnd.uniform(0.5, 1.5) * think_s):
+            return
+        pil_img = frames[(idx * 7919 + seq) % len(frames)]
+        seq += 1
+        case = {"case_id": f"{idx}-{seq}", "ts_scan_pressed": None}
+
+        started = time.perf_counter()
+        try:
+            result = run_sync(_scan(pil_img), case=case)
+        except Exception as e:
+            if started >= measure_from:
+                step.error(type(e).__name__)
+            continue
+        scanned = time.perf_counter()
+
+        serial_number, conf = result[0], result[1]
+        if save:
+            try:
+                append_result({
+                    "experiment_id": "load-test", "case_id": case["case_id"], "task": agent.task_type,
+                    "agent": getattr(agent, "agent_name", type(agent).__name__), "input_type": "camera",
+                    "serial_number": serial_number, "confidence": conf,
+                    "image_path": save_image(pil_img), "notes": "load-test",
+                    **{k: v for k, v in case.items() if k.startswith("ts_")},
+                })
+            except Exception as e:
+                step.error(f"save:{type(e).__name__}")
+        done = time.perf_counter()
+
+        if started < measure_from:
+            continue  # warm-up
+        with step.lock:
+            step.scan_ms.append((scanned - started) * 1000)
+            step.save_ms.append((done - scanned) * 1000)
+            step.done_at.append(scanned)
+            if not serial_number:
+                step.empty += 1
+
+
+def run_step(n_sessions, agent, frames, args):
+    from scan_scheduler import get_scheduler
+    from rate_limiter import get_rate_limiter
+
+    step = Step()
+    stop = threading.Event()
+    measure_from = time.perf_counter() + args.warmup_seconds
+    threads = [
+        threading.Thread(
+            target=_session, args=(i, agent, frames, args.think_ms / 1000, not args.no_save, stop, measure_from, step),
+            daemon=True,
+        )
+        for i in range(n_sessions)
+    ]
+    for t in threads:
+        t.start()
+
+    time.sleep(args.warmup_seconds)
+    cpu0, wall0 = _cpu_seconds(), time.perf_counter()
+    time.sleep(args.step_seconds)
+    cpu1, wall1 = _cpu_seconds(), time.perf_counter()
+    rss = _rss_mb()
+    sched = get_scheduler().metrics()
+    limiter = get_rate_limiter().metrics()
+
+    stop.set()
+    for t in threads:
+        t.join()
+
+    wall = wall1 - wall0
+    with step.lock:
+        scan_ms, save_ms = list(step.scan_ms), list(step.save_ms)
+        completed = sum(wall0 <= t <= wall1 for t in step.done_at)
+    return {
+        "sessions": n_sessions,
+        "scans": completed,
+        "scans_per_s": completed / wall,
+        "p50_ms": _percentile(scan_ms, 0.50),
+        "p95_ms": _percentile(scan_ms, 0.95),
+        "p99_ms": _percentile(scan_ms, 0.99),
+        "save_p95_ms": _percentile(save_ms, 0.95),
+        "queue_wait_p95_ms": sched["wait_p95_ms"],
+        "ratelimit_wait_p95_ms": limiter["wait_p95_ms"],
+        "ratelimited": limiter["throttled"],
+        "no_serial": step.empty,
+        "errors": dict(step.errors),
+        "cpu_pct": (cpu1 - cpu0) / wall * 100,
+        "rss_mb": rss,
+    }
+
+
+def _print_row(r, out):
+    errors = sum(r["errors"].values())
+    print(
+        f"{r['sessions']:>8} {r['scans_per_s']:>8.2f} {r['p50_ms']:>8.0f} {r['p95_ms']:>8.0f} {r['p99_ms']:>8.0f}"
+        f" {r['save_p95_ms']:>9.1f} {r['queue_wait_p95_ms']:>9.0f} {r['ratelimit_wait_p95_ms']:>8.0f} {errors:>7} {r['cpu_pct']:>6.0f}% {r['rss_mb']:>8.0f}",
+        file=out, flush=True,
+    )
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--agent", choices=sorted(AGENTS), default="serial")
+    p.add_argument("--sessions", default="1,2,4,8,16,32", help="comma-separated concurrency ramp")
+    p.add_argument("--step-seconds", type=float, default=20, help="measured time per concurrency step")
+    p.add_argument("--warmup-seconds", type=float, default=3, help="unmeasured ramp-up per step")
+    p.add_argument("--think-ms", type=float, default=1500, help="mean operator think time between scans")
+    p.add_argument("--ocr-ms", type=float, default=150, help="mean stub OCR latency")
+    p.add_argument("--gpt-ms", type=float, default=800, help="mean stub GPT latency")
+    p.add_argument("--early-accept-rate", type=float, default=0.5, help="share of OCR reads above 0.95 (no GPT)")
+    p.add_argument("--frames", type=int, default=32, help="distinct frames to cycle through")
+    p.add_argument("--image", help="use this photo instead of a synthetic plate")
+    p.add_argument("--no-save", action="store_true", help="skip the persistence save path")
+    p.add_argument("--json", help="also write the step results to this file")
+    p.add_argument("--verbose", action="store_true", help="keep the agents' per-scan log output")
+    p.add_argument("--stub-port", type=int, default=0, help="fixed port for the stub backends (default: any)")
+    p.add_argument("--serve-stubs", action="store_true",
+                   help="only run the stub backends (e.g. for scan_worker.py processes) until Ctrl+C")
+    p.add_argument("--scan-worker-url", help="drive a scan worker service instead of in-process agents")
+    args = p.parse_args(argv)
+    levels = [int(x) for x in args.sessions.split(",") if x.strip()]
+
+    stub_proc, port = start_stubs(args.ocr_ms, args.gpt_ms, args.early_accept_rate, port=args.stub_port)
+    if args.serve_stubs:
+        print(f"🧪 Stub backends on port {port}:\n"
+              f"   OCR_API_URL=http://127.0.0.1:{port}/scan_serial OPENAI_BASE_URL=http://127.0.0.1:{port}/v1")
+        try:
+            stub_proc.join()
+        except KeyboardInterrupt:
+            stub_proc.terminate()
+        return []
+    json_path = os.path.abspath(args.json) if args.json else None
+    image_path = os.path.abspath(args.image) if args.image else None
+
+    # everything below must see the stubs and the scratch results dir
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    os.environ["OPENAI_API_KEY"] = "load-test"
+    os.environ.setdefault("VISION_CACHE_MODE", "off")  # every scan really calls the (stub) model
+    os.environ.setdefault("OPENAI_RPM", "0")  # stubs have no rate limits (set these to test the limiter)
+    os.environ.setdefault("OPENAI_TPM", "0")
+    workdir = tempfile.mkdtemp(prefix="inspection_load_")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+
+    out = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")  # agents log every scan; only the report goes to the terminal
+
+    import importlib
+    module_name, class_name = AGENTS[args.agent]
+    if args.scan_worker_url:
+        from scan_client import RemoteScanAgent
+        agent = RemoteScanAgent(class_name, base_url=args.scan_worker_url)
+        class_name = f"{class_name} @ {args.scan_worker_url}"
+    else:
+        agent_cls = getattr(importlib.import_module(module_name), class_name)
+        agent = agent_cls(api_url=f"http://127.0.0.1:{port}/scan_serial")
+    frames = make_frames(args.frames, image_path=image_path)
+
+    print(f"🚦 Load test: {class_name}, think {args.think_ms:.0f} ms, stub OCR {args.ocr_ms:.0f} ms / "
+          f"GPT {args.gpt_ms:.0f} ms, early accept {args.early_accept_rate:.0%}, results in {workdir}", file=out)
+    print(f"{'sessions':>8} {'scans/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'save p95':>9}"
+          f" {'wait p95':>9} {'rl p95':>8} {'errors':>7} {'cpu':>7} {'rss MB':>8}", file=out, flush=True)
+
+    results = []
+    try:
+        for n in levels:
+            r = run_step(n, agent, frames, args)
+            results.append(r)
+            _print_row(r, out)
+            if r["errors"]:
+                print(f"         errors: {r['errors']}", file=out)
+    finally:
+        stub_proc.terminate()
+        sys.stdout = out
+
+    if results:
+        base = results[0]["p95_ms"] or 1
+        knee = next((r["sessions"] for r in results if r["p95_ms"] > 2 * base or r["errors"]), None)
+        if knee:
+            print(f"⚠️ Latency degrades (p95 > 2x single-session or errors) from {knee} concurrent sessions.")
+        else:
+            print("✅ No degradation within the tested range.")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({"args": vars(args), "steps": results}, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,23 @@
 # manual_serial_entry_agent.py
 import re
 
+from serial_index import get_serial_index
+
 class ManualSerialEntryAgent:
-    def __init__(self):
-        pass
+    def __init__(self, index=None):
+        # shared, incrementally updated prefix index (known serials + previously saved serials)
+        self.index = index or get_serial_index()
 
     def validate(self, text: str) -> bool:
         if not text:
             return False
         s = text.strip()
-        return bool(re.fullmatch(r"[A-Za-z0-9\-_/\. ]{1,64}", s))
\ No newline at end of file
+        return bool(re.fullmatch(r"[A-Za-z0-9\-_/\. ]{1,64}", s))
+
+    def suggest(self, prefix: str, limit: int = 8):
+        """Type-ahead: list of (serial, source) with source in {"known", "saved"}."""
+        return self.index.suggest(prefix, limit=limit)
+
+    def lookup(self, text: str):
+        """(serial, source) if the entry matches a known or previously saved serial, else None."""
+        return self.index.lookup(text)
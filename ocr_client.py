@@ -0,0 +1,124 @@
+# ocr_client.py
+import io
+import asyncio
+from urllib.parse import urlsplit
+
+from PIL import Image
+
+from agent_runtime import get_http_client, add_case_usage
+
+
+def _jpeg_bytes(pil_img: Image.Image) -> bytes:
+    buffered = io.BytesIO()
+    pil_img.convert("RGB").save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+
+def _parse_result(data: dict):
+    return data.get("serial_number"), data.get("confidence", 0.0)
+
+
+def _to_box(value):
+    """(x0, y0, x1, y1) from [x0, y0, x1, y1] or a PaddleOCR polygon [[x, y], ...]; None if malformed."""
+    try:
+        if len(value) == 4 and all(isinstance(v, (int, float)) for v in value):
+            x0, y0, x1, y1 = (float(v) for v in value)
+        else:
+            xs, ys = zip(*((float(p[0]), float(p[1])) for p in value))
+            x0, y0, x1, y1 = min(xs), min(ys), max(xs), max(ys)
+    except (TypeError, ValueError, IndexError):
+        return None
+    return (x0, y0, x1, y1) if x1 > x0 and y1 > y0 else None
+
+
+def parse_text_boxes(data: dict):
+    """
+    Optional text boxes of an OCR response (image pixel coordinates):
+      "serial_box": box of the serial text
+      "boxes": [box, ...] or [{"text": ..., "box": box}, ...] for every detected text line
+    Returns {"serial": box | None, "text": [box, ...]}, or None if the server sent no boxes.
+    """
+    serial_box = _to_box(data["serial_box"]) if data.get("serial_box") else None
+    serial_key = "".join(str(data.get("serial_number") or "").split()).upper()
+    text = []
+    for entry in data.get("boxes") or []:
+        box = _to_box(entry.get("box") if isinstance(entry, dict) else entry)
+        if box is None:
+            continue
+        text.append(box)
+        if serial_box is None and serial_key and isinstance(entry, dict):
+            if serial_key in "".join(str(entry.get("text") or "").split()).upper():
+                serial_box = box
+    if serial_box is None and not text:
+        return None
+    return {"serial": serial_box, "text": [b for b in text if b != serial_box]}
+
+
+async def warm_up_ocr(api_url: str, timeout: float = 5):
+    """Open a pooled connection to the OCR server (DNS + TCP) before the first scan; any status is fine."""
+    parts = urlsplit(api_url)
+    try:
+        await get_http_client().get(f"{parts.scheme}://{parts.netloc}/", timeout=timeout)
+    except Exception as e:
+        print("⚠️ OCR warm-up failed:", e)
+
+
+async def ocr_image(api_url: str, pil_img: Image.Image, timeout: float = 10, *, with_boxes: bool = False):
+    """
+    Send one image to the PaddleOCR server.
+    Returns (serial_number, confidence), or (None, None) if the server is unavailable.
+    with_boxes=True appends the response's text boxes (see parse_text_boxes; None if absent).
+    """
+    data = await asyncio.to_thread(_jpeg_bytes, pil_img)  # keep encoding off the event loop
+    files = {"file": ("image.jpg", data, "image/jpeg")}
+    add_case_usage(usage_ocr_bytes=len(data))
+
+    try:
+        response = await get_http_client().post(api_url, files=files, timeout=timeout)
+
+        if response.status_code != 200:
+            print(f"❌ OCR API error: {response.status_code} - {response.text}")
+            return (None, None, None) if with_boxes else (None, None)
+
+        data = response.json()
+        if with_boxes:
+            return (*_parse_result(data), parse_text_boxes(data))
+        return _parse_result(data)
+
+    except Exception as e:
+        print("❌ OCR API not reachable:", e)
+        return (None, None, None) if with_boxes else (None, None)
+
+
+async def _ocr_batch(batch_api_url: str, images: list, timeout: float):
+    encoded = await asyncio.gather(*(asyncio.to_thread(_jpeg_bytes, img) for img in images))
+    files = [("files", (f"crop_{i}.jpg", data, "image/jpeg")) for i, data in enumerate(encoded)]
+    add_case_usage(usage_ocr_bytes=sum(len(data) for data in encoded))
+    response = await get_http_client().post(batch_api_url, files=files, timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.status_code} - {response.text}")
+
+    data = response.json()
+    results = data.get("results", []) if isinstance(data, dict) else data
+    if len(results) != len(images):
+        raise RuntimeError(f"expected {len(images)} results, got {len(results)}")
+    return [_parse_result(r) for r in results]
+
+
+async def ocr_images(api_url: str, images: list, *, batch_api_url: str | None = None, timeout: float = 10):
+    """
+    OCR several images (e.g. label crops) at once.
+    Uses ONE batch request if the server offers a batch endpoint, otherwise
+    falls back to concurrent single requests.
+    Returns a list of (serial_number, confidence) in input order.
+    """
+    if not images:
+        return []
+
+    if batch_api_url:
+        try:
+            return await _ocr_batch(batch_api_url, images, timeout)
+        except Exception as e:
+            print("⚠️ OCR batch request failed, falling back to parallel requests:", e)
+
+    return list(await asyncio.gather(*(ocr_image(api_url, img, timeout) for img in images)))
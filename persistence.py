@@ -1,25 +1,161 @@
 # persistence.py
-import os, csv, uuid, datetime
+import os, io, csv, base64, hashlib, datetime, functools, threading, contextlib, tempfile
 from PIL import Image
 
-RESULTS_DIR = "results"
+try:
+    import fcntl
+except ImportError:  # Windows: locking between threads of one process only
+    fcntl = None
+
+# all UI replicas / scan workers of one deployment point RESULTS_DIR at the same store
+RESULTS_DIR = os.getenv("RESULTS_DIR", "results")
 IMAGES_DIR = os.path.join(RESULTS_DIR, "images")
+THUMBS_DIR = os.path.join(RESULTS_DIR, "thumbs")
 CSV_PATH = os.path.join(RESULTS_DIR, "experiments.csv")
+LOCK_PATH = os.path.join(RESULTS_DIR, ".experiments.lock")
+
+THUMB_SIZE = (160, 160)
+
+_csv_lock = threading.RLock()  # append_result / update_result from UI threads and background workers
+_save_listeners = []  # called with every saved row (in-memory indexes stay current without re-reading the CSV)
+
+
+def add_save_listener(fn):
+    """Register fn(row) to be called after each append_result."""
+    _save_listeners.append(fn)
 
 
 def _ensure_dirs():
     os.makedirs(IMAGES_DIR, exist_ok=True)
 
 
+@contextlib.contextmanager
+def _results_lock():
+    """CSV writes are serialized between threads and (flock) between processes sharing RESULTS_DIR."""
+    with _csv_lock:
+        if fcntl is None:
+            yield
+            return
+        _ensure_dirs()
+        with open(LOCK_PATH, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# --- content-addressed image store ---
+def _sharded_path(root: str, name: str) -> str:
+    """results/<root>/ab/cd/abcd....jpg -> keeps every directory small."""
+    stem = os.path.splitext(name)[0]
+    return os.path.join(root, stem[:2], stem[2:4], name)
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # unique temp file per writer: sessions saving the same hash at once must not share one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)  # mkstemp creates 0600; other workers / the web server read these
+        os.replace(tmp_path, path)  # concurrent writers of the same hash end up with identical bytes
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_thumbnail(pil_img, thumb_path: str):
+    thumb = pil_img.copy()
+    thumb.thumbnail(THUMB_SIZE)
+    buffered = io.BytesIO()
+    thumb.convert("RGB").save(buffered, format="JPEG", quality=80)
+    _write_atomic(thumb_path, buffered.getvalue())
+
+
 def save_image(pil_img) -> str:
-    """Save image and return relative path."""
+    """
+    Save image and return relative path.
+    Files are named by the sha256 of their JPEG bytes, so re-scans of the same frame
+    are stored only once. A small thumbnail is written next to it on first save.
+    """
     _ensure_dirs()
-    img_name = f"{uuid.uuid4().hex}.jpg"
-    img_path = os.path.join(IMAGES_DIR, img_name)
-    pil_img.save(img_path, format="JPEG", quality=92)
+    if pil_img.mode not in ("RGB", "L"):
+        pil_img = pil_img.convert("RGB")
+
+    buffered = io.BytesIO()
+    pil_img.save(buffered, format="JPEG", quality=92)
+    data = buffered.getvalue()
+
+    img_name = f"{hashlib.sha256(data).hexdigest()}.jpg"
+    img_path = _sharded_path(IMAGES_DIR, img_name)
+    if not os.path.exists(img_path):
+        _write_atomic(img_path, data)
+
+    thumb_path = _sharded_path(THUMBS_DIR, img_name)
+    if not os.path.exists(thumb_path):
+        _write_thumbnail(pil_img, thumb_path)
+
     return os.path.relpath(img_path)
 
 
+_thumb_pool = None
+_thumb_pending = set()
+_thumb_lock = threading.Lock()
+
+
+def _create_thumbnail(image_path: str, thumb_path: str):
+    try:
+        with Image.open(image_path) as im:
+            im.draft("RGB", THUMB_SIZE)  # decode JPEGs at reduced scale
+            _write_thumbnail(im, thumb_path)
+    except Exception as e:
+        print("❌ Could not create thumbnail:", e)
+    finally:
+        with _thumb_lock:
+            _thumb_pending.discard(thumb_path)
+
+
+def _queue_thumbnail(image_path: str, thumb_path: str):
+    """Generate a legacy image's thumbnail on a background thread (once)."""
+    global _thumb_pool
+    with _thumb_lock:
+        if thumb_path in _thumb_pending:
+            return
+        _thumb_pending.add(thumb_path)
+        if _thumb_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _thumb_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbs")
+    _thumb_pool.submit(_create_thumbnail, image_path, thumb_path)
+
+
+@functools.lru_cache(maxsize=4096)
+def _thumb_uri(thumb_path: str) -> str:
+    with open(thumb_path, "rb") as f:
+        return "data:image/jpeg;base64," + base64.b64encode(f.read()).decode("ascii")
+
+
+def thumbnail_data_uri(image_path: str) -> str | None:
+    """
+    Return the thumbnail of a saved image as a data URI (for st.column_config.ImageColumn).
+    Legacy images (flat uuid layout) get their thumbnail generated in the background on first
+    access (None until it exists); misses are never cached.
+    """
+    if not image_path:
+        return None
+    thumb_path = _sharded_path(THUMBS_DIR, os.path.basename(image_path))
+    if not os.path.exists(thumb_path):
+        if os.path.exists(image_path):
+            _queue_thumbnail(image_path, thumb_path)
+        return None
+    try:
+        return _thumb_uri(thumb_path)
+    except OSError:
+        return None
+
+
 # --- new helpers for dynamic CSV schema ---
 def _read_csv():
     if not os.path.exists(CSV_PATH):
@@ -30,12 +166,14 @@ def _read_csv():
 
 
 def _write_csv(fieldnames, rows):
-    with open(CSV_PATH, "w", newline="", encoding="utf-8") as f:
+    tmp_path = f"{CSV_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
         w = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
         w.writeheader()
         for r in rows:
             # fill missing keys with empty string
             w.writerow({k: r.get(k, "") for k in fieldnames})
+    os.replace(tmp_path, CSV_PATH)  # readers never see a half-written file
 
 
 def append_result(row: dict):
@@ -49,6 +187,17 @@ def append_result(row: dict):
     row = dict(row)  # copy to avoid side effects
     row.setdefault("timestamp_iso", datetime.datetime.now().isoformat(timespec="seconds"))
 
+    with _results_lock():
+        _append_locked(row)
+
+    for fn in list(_save_listeners):
+        try:
+            fn(row)
+        except Exception as e:
+            print("❌ Save listener failed:", e)
+
+
+def _append_locked(row: dict):
     existing_fields, rows = _read_csv()
 
     # default field order (keeps your old layout, but allows new cols after)
@@ -58,7 +207,7 @@ def append_result(row: dict):
         "serial_number", "confidence",
         "image_path", "notes",
         # timeline fields
-        "ts_camera_start", "ts_scan_pressed", "ts_ocr_result",
+        "ts_camera_start", "ts_scan_pressed", "ts_scan_started", "ts_ocr_result",
         "ts_gpt_result", "ts_gpt_verification",
         "ts_accept_save_pressed", "ts_edit_pressed", "ts_save_edited_pressed",
         "ts_result_saved",
@@ -90,6 +239,51 @@ def append_result(row: dict):
         w.writerow({k: row.get(k, "") for k in fieldnames})
 
 
+def update_result(case_id: str, updates: dict) -> int:
+    """
+    Update saved row(s) of a case in place (e.g. backfill of an offline-queued scan).
+    Expands the header for new keys. Returns the number of rows changed.
+    """
+    changed = []
+    with _results_lock():
+        fieldnames, rows = _read_csv()
+        for k in updates:
+            if k not in fieldnames:
+                fieldnames.append(k)
+        for r in rows:
+            if r.get("case_id") == case_id:
+                r.update({k: ("" if v is None else v) for k, v in updates.items()})
+                changed.append(r)
+        if changed:
+            _write_csv(fieldnames, rows)
+
+    for r in changed:
+        for fn in list(_save_listeners):
+            try:
+                fn(r)
+            except Exception as e:
+                print("❌ Save listener failed:", e)
+    return len(changed)
+
+
+def results_header() -> list[str]:
+    """Current CSV header (column order of experiments.csv)."""
+    if not os.path.exists(CSV_PATH):
+        return []
+    with open(CSV_PATH, "r", newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), [])
+
+
+def iter_results(experiment_id: str | None = None):
+    """Stream saved rows one by one (optionally only one experiment) without loading the whole CSV."""
+    if not os.path.exists(CSV_PATH):
+        return
+    with open(CSV_PATH, "r", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if experiment_id is None or row.get("experiment_id") == experiment_id:
+                yield row
+
+
 def read_results() -> list[dict]:
     if not os.path.exists(CSV_PATH):
         return []
@@ -0,0 +1,210 @@
+# rate_limiter.py
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import openai
+
+from agent_runtime import add_case_usage
+from scan_scheduler import CURRENT_PRIORITY
+
+
+def retry_after_s(e: Exception, attempt: int) -> float:
+    """Delay requested by a 429 (retry-after-ms / retry-after seconds or HTTP date), else exponential backoff."""
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                pass
+    return min(2 ** attempt, 20)
+
+
+class _Bucket:
+    """Token bucket refilled continuously up to its per-minute limit."""
+
+    def __init__(self, per_min: float):
+        self.capacity = per_min
+        self.rate = per_min / 60.0
+        self.level = per_min
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        amount = min(amount, self.capacity)  # oversized requests wait for a full bucket, never forever
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class RateLimiter:
+    """
+    Process-wide OpenAI limiter: requests/min and tokens/min token buckets shared by all sessions.
+
+    - callers wait in line instead of failing; the line is ordered by scan priority
+      (TASK_PRIORITIES of the running scan, lowest first), then arrival
+    - a 429 pauses ALL callers for its retry-after and the request is retried
+      (connection errors / 5xx too, with a short backoff)
+    - token use is estimated up front and settled with the real usage of the response
+    - per case: usage_ratelimit_wait_ms (time spent waiting) and usage_ratelimited (429s)
+    """
+
+    def __init__(self, rpm: float = 500, tpm: float = 30000, max_retries: int = 4,
+                 max_retry_after_s: float = 20, transient_retries: int = 2):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.max_retry_after_s = max_retry_after_s
+        self.transient_retries = transient_retries
+        self._requests = _Bucket(rpm) if rpm > 0 else None  # 0 = unlimited
+        self._tokens = _Bucket(tpm) if tpm > 0 else None
+        self._paused_until = 0.0
+        self._waiters = []              # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._waits_ms = deque(maxlen=500)
+        self._granted = 0
+        self._throttled = 0
+        self._lock = threading.Lock()   # shared by the agent loop, worker loops and metric readers
+
+    # ----------------- admission -----------------
+
+    def _try_grant(self, entry, tokens, now):
+        """None if granted (capacity consumed), else seconds to sleep before checking again. Lock held."""
+        if self._waiters[0] != entry:
+            return 0.05  # someone with higher priority / earlier arrival goes first
+        buckets = [(b, n) for b, n in ((self._requests, 1), (self._tokens, tokens)) if b is not None]
+        for bucket, _ in buckets:
+            bucket.refill(now)
+        delay = max([self._paused_until - now] + [b.wait_for(n) for b, n in buckets])
+        if delay > 0:
+            return delay
+        for bucket, n in buckets:
+            bucket.level -= n
+        heapq.heappop(self._waiters)
+        self._granted += 1
+        return None
+
+    async def acquire(self, tokens: float, priority: int) -> float:
+        """Wait for one request slot and `tokens` tokens; returns the wait in ms."""
+        start = time.monotonic()
+        entry = (priority, next(self._seq))
+        with self._lock:
+            heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                with self._lock:
+                    delay = self._try_grant(entry, tokens, time.monotonic())
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+        except BaseException:
+            with self._lock:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+            raise
+
+        waited_ms = (time.monotonic() - start) * 1000
+        with self._lock:
+            self._waits_ms.append(waited_ms)
+        return waited_ms
+
+    def _pause(self, seconds: float):
+        with self._lock:
+            self._throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _settle(self, estimated: float, actual):
+        if self._tokens is None or actual is None:
+            return
+        with self._lock:
+            self._tokens.level += estimated - actual  # refund (or charge) the estimate error
+
+    # ----------------- calls -----------------
+
+    async def call(self, factory, *, tokens: float, priority: int | None = None):
+        """
+        Run factory() (returns one OpenAI request coroutine) within the limits and return its response.
+        Priority defaults to the running scan's task priority.
+        """
+        if priority is None:
+            priority = CURRENT_PRIORITY.get()
+        waited_ms = 0.0
+        throttled = 0
+        transient = 0
+        try:
+            while True:
+                waited_ms += await self.acquire(tokens, priority)
+                try:
+                    response = await factory()
+                except openai.RateLimitError as e:
+                    if getattr(e, "code", None) == "insufficient_quota" or throttled >= self.max_retries:
+                        raise
+                    delay = min(max(retry_after_s(e, throttled), 0.0), self.max_retry_after_s)
+                    throttled += 1
+                    self._pause(delay)
+                    print(f"⏳ OpenAI rate limit (429) - all vision calls paused for {delay:.1f}s")
+                    continue
+                except (openai.APIConnectionError, openai.InternalServerError):
+                    if transient >= self.transient_retries:
+                        raise
+                    transient += 1
+                    await asyncio.sleep(0.5 * 2 ** transient)
+                    continue
+                usage = getattr(response, "usage", None)
+                self._settle(tokens, getattr(usage, "total_tokens", None))
+                return response
+        finally:
+            add_case_usage(usage_ratelimit_wait_ms=round(waited_ms), usage_ratelimited=throttled)
+
+    def metrics(self) -> dict:
+        """Limiter snapshot (safe to call from any thread)."""
+        with self._lock:
+            now = time.monotonic()
+            for bucket in (self._requests, self._tokens):
+                if bucket is not None:
+                    bucket.refill(now)
+            waits = sorted(self._waits_ms)
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "waiting": len(self._waiters),
+                "requests_available": self._requests.level if self._requests else None,
+                "tokens_available": self._tokens.level if self._tokens else None,
+                "paused_s": max(0.0, self._paused_until - now),
+                "wait_p50_ms": waits[len(waits) // 2] if waits else 0.0,
+                "wait_p95_ms": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                "granted": self._granted,
+                "throttled": self._throttled,
+            }
+
+
+_LIMITER = None
+_LIMITER_LOCK = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _LIMITER
+    with _LIMITER_LOCK:
+        if _LIMITER is None:
+            _LIMITER = RateLimiter(
+                rpm=float(os.getenv("OPENAI_RPM", "500")),
+                tpm=float(os.getenv("OPENAI_TPM", "30000")),
+            )
+    return _LIMITER
@@ -0,0 +1,156 @@
+# results_export.py
+import io
+import os
+import csv
+import tempfile
+from datetime import datetime, timezone
+from itertools import islice
+
+from persistence import iter_results, results_header
+
+CHUNK_ROWS = 5000
+
+# typed columns for the columnar formats (everything else stays a string);
+# usage_* accounting columns are integers (tokens / bytes) except the *_usd cost
+FLOAT_COLUMNS = {"confidence"}
+INT_COLUMNS = {"label_index", "damage_count"}
+
+FORMATS = {
+    # label: (file extension, mime type)
+    "CSV": (".csv", "text/csv"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+    "Arrow IPC": (".arrow", "application/vnd.apache.arrow.file"),
+}
+
+
+def _chunks(rows, size=CHUNK_ROWS):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ===================== CSV =====================
+def stream_csv(experiment_id: str | None = None, chunk_rows: int = CHUNK_ROWS):
+    """Yield the export as UTF-8 CSV byte chunks (header first); never holds more than one chunk."""
+    header = results_header()
+    if not header:
+        return
+    buffered = io.StringIO()
+    w = csv.DictWriter(buffered, fieldnames=header, extrasaction="ignore")
+    w.writeheader()
+    for chunk in _chunks(iter_results(experiment_id), chunk_rows):
+        w.writerows(chunk)
+        yield buffered.getvalue().encode("utf-8")
+        buffered.seek(0)
+        buffered.truncate()
+    if buffered.tell():
+        yield buffered.getvalue().encode("utf-8")  # header only (no matching rows)
+
+
+# ===================== Parquet / Arrow IPC =====================
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        return pa
+    except ImportError:
+        raise RuntimeError("Parquet/Arrow export needs pyarrow (pip install pyarrow).")
+
+
+def columnar_available() -> bool:
+    try:
+        _pyarrow()
+        return True
+    except RuntimeError:
+        return False
+
+
+def _parse_ts(value: str):
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return ts.astimezone(timezone.utc) if ts.tzinfo else ts
+
+
+def _parse_number(value: str, cast):
+    if value in (None, ""):
+        return None
+    try:
+        return cast(float(value))
+    except (ValueError, OverflowError):  # e.g. int(float("inf")) - one bad cell must not abort the export
+        return None
+
+
+def arrow_schema(header: list[str]):
+    pa = _pyarrow()
+    fields = []
+    for name in header:
+        if name.startswith("ts_"):
+            fields.append(pa.field(name, pa.timestamp("ms", tz="UTC")))
+        elif name == "timestamp_iso":
+            fields.append(pa.field(name, pa.timestamp("s")))  # naive server-local time
+        elif name in FLOAT_COLUMNS or (name.startswith("usage_") and name.endswith("_usd")):
+            fields.append(pa.field(name, pa.float64()))
+        elif name in INT_COLUMNS or name.startswith("usage_"):
+            fields.append(pa.field(name, pa.int64()))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def _record_batches(schema, experiment_id, chunk_rows):
+    pa = _pyarrow()
+    for chunk in _chunks(iter_results(experiment_id), chunk_rows):
+        arrays = []
+        for field in schema:
+            values = [r.get(field.name) or None for r in chunk]
+            if pa.types.is_timestamp(field.type):
+                values = [_parse_ts(v) for v in values]
+            elif pa.types.is_floating(field.type):
+                values = [_parse_number(v, float) for v in values]
+            elif pa.types.is_integer(field.type):
+                values = [_parse_number(v, int) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_columnar(sink, fmt: str, experiment_id: str | None = None, chunk_rows: int = CHUNK_ROWS):
+    """Stream the export into sink (path or binary file) as 'Parquet' or 'Arrow IPC', one batch at a time."""
+    schema = arrow_schema(results_header())
+
+    if fmt == "Parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        import pyarrow.ipc as ipc
+        writer = ipc.new_file(sink, schema)
+
+    try:
+        for batch in _record_batches(schema, experiment_id, chunk_rows):
+            if fmt == "Parquet":
+                writer.write_batch(batch)
+            else:
+                writer.write(batch)
+    finally:
+        writer.close()
+
+
+def export_to_file(fmt: str, experiment_id: str | None = None) -> str:
+    """Write an export to a temp file (generated on demand only) and return its path."""
+    ext, _ = FORMATS[fmt]
+    fd, path = tempfile.mkstemp(prefix="experiments_", suffix=ext)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if fmt == "CSV":
+                for chunk in stream_csv(experiment_id):
+                    f.write(chunk)
+            else:
+                write_columnar(f, fmt, experiment_id)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
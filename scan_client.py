@@ -0,0 +1,115 @@
+# scan_client.py
+import io
+import os
+import asyncio
+
+import httpx
+from PIL import Image
+
+from agent_runtime import get_http_client, merge_case, mark_backend_unavailable, run_sync, CURRENT_SESSION
+from scan_scheduler import SchedulerBusy
+
+# task type (scheduler priority class) of each agent served by scan_worker.py
+TASK_TYPES = {
+    "SerialNumberAgent": "serial_number",
+    "SerialNumberKnowledgeAgent": "serial_number_knowledge",
+    "ScannerAgent": "scanner",
+}
+
+
+def scan_worker_url() -> str | None:
+    return os.getenv("SCAN_WORKER_URL") or None
+
+
+def ocr_endpoints() -> dict:
+    """Constructor kwargs for in-process serial agents from OCR_API_URL / OCR_BATCH_API_URL (if set)."""
+    kwargs = {}
+    if os.getenv("OCR_API_URL"):
+        kwargs["api_url"] = os.environ["OCR_API_URL"]
+    if os.getenv("OCR_BATCH_API_URL"):
+        kwargs["batch_api_url"] = os.environ["OCR_BATCH_API_URL"]
+    return kwargs
+
+
+def _jpeg_bytes(pil_img: Image.Image) -> bytes:
+    buffered = io.BytesIO()
+    pil_img.convert("RGB").save(buffered, format="JPEG", quality=95)
+    return buffered.getvalue()
+
+
+class RemoteScanAgent:
+    """
+    Thin client with the same scan() / scan_multi() / scan_consensus() contract as the in-process serial agents;
+    the pipeline runs in the scan worker service (scan_worker.py).
+    Timestamps and usage recorded by the worker are merged into the caller's case.
+    An unreachable worker counts as a backend outage ("scan-worker") -> offline capture queue.
+    """
+
+    def __init__(self, agent_name: str, base_url: str | None = None, timeout: float = 120):
+        if agent_name not in TASK_TYPES:
+            raise ValueError(f"Agent {agent_name!r} is not served by the scan worker")
+        self.agent_name = agent_name
+        self.base_url = (base_url or scan_worker_url() or "http://127.0.0.1:8600").rstrip("/")
+        self.timeout = timeout
+        self.task_type = TASK_TYPES[agent_name]
+        self.is_auto_save = agent_name == "ScannerAgent"
+
+    def _empty_result(self):
+        if self.agent_name == "SerialNumberKnowledgeAgent":
+            return None, 0.0, False, "none"
+        return None, 0.0
+
+    async def _post(self, path: str, pil_imgs: list, task_type: str | None, field: str = "file"):
+        encoded = await asyncio.gather(*(asyncio.to_thread(_jpeg_bytes, img) for img in pil_imgs))
+        files = [(field, (f"frame_{i}.jpg", data, "image/jpeg")) for i, data in enumerate(encoded)]
+        form = {
+            "agent": self.agent_name,
+            "task_type": task_type or self.task_type,
+            "session_id": CURRENT_SESSION.get() or "",
+        }
+        try:
+            response = await get_http_client().post(
+                f"{self.base_url}{path}", files=files, data=form, timeout=self.timeout,
+            )
+        except httpx.HTTPError as e:
+            print("❌ Scan worker not reachable:", e)
+            mark_backend_unavailable("scan-worker")
+            return None
+
+        if response.status_code == 503:
+            raise SchedulerBusy(response.json().get("detail", "Scan worker is busy."))
+        if response.status_code != 200:
+            print(f"❌ Scan worker error: {response.status_code} - {response.text}")
+            mark_backend_unavailable("scan-worker")
+            return None
+
+        body = response.json()
+        merge_case(body.get("case") or {})
+        return body["result"]
+
+    async def warm_up_async(self):
+        """Open the connection to the worker and let it warm up its own agent (OCR / OpenAI pools)."""
+        try:
+            await get_http_client().post(f"{self.base_url}/warmup", data={"agent": self.agent_name}, timeout=30)
+        except httpx.HTTPError as e:
+            print("⚠️ Scan worker warm-up failed:", e)
+
+    async def scan_async(self, pil_img: Image.Image, *, task_type: str | None = None):
+        result = await self._post("/scan", [pil_img], task_type)
+        return self._empty_result() if result is None else tuple(result)
+
+    async def scan_multi_async(self, pil_img: Image.Image, *, task_type: str | None = None):
+        return await self._post("/scan_multi", [pil_img], task_type) or []
+
+    async def scan_consensus_async(self, frames: list, *, task_type: str | None = None):
+        result = await self._post("/scan_consensus", frames, task_type, field="files")
+        return self._empty_result() if result is None else tuple(result)
+
+    def scan(self, pil_img: Image.Image):
+        return run_sync(self.scan_async(pil_img))
+
+    def scan_multi(self, pil_img: Image.Image):
+        return run_sync(self.scan_multi_async(pil_img))
+
+    def scan_consensus(self, frames: list):
+        return run_sync(self.scan_consensus_async(frames))
@@ -0,0 +1,192 @@
+# scan_scheduler.py
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from contextvars import ContextVar
+from collections import OrderedDict, deque
+
+from agent_runtime import get_loop, stamp_case, CURRENT_SESSION
+
+# lower = served first
+TASK_PRIORITIES = {
+    "scanner": 0,                    # operator at the aircraft, auto-save
+    "serial_number": 1,
+    "serial_number_knowledge": 1,
+    "damage_detection": 2,
+    "batch": 5,                      # reprocessing / backfill / evaluation
+}
+DEFAULT_PRIORITY = 3
+
+# priority of the running scan (read by the OpenAI rate limiter to order waiting calls)
+CURRENT_PRIORITY: ContextVar[int] = ContextVar("scan_priority", default=DEFAULT_PRIORITY)
+
+
+class SchedulerBusy(Exception):
+    """Raised when the scan queue is full (backpressure) - the UI should ask the operator to retry."""
+
+
+class _Job:
+    __slots__ = ("factory", "priority", "session_id", "context", "future", "task", "enqueued_at")
+
+    def __init__(self, factory, priority, session_id, context, future):
+        self.factory = factory
+        self.priority = priority
+        self.session_id = session_id
+        self.context = context
+        self.future = future
+        self.task = None
+        self.enqueued_at = time.monotonic()
+
+
+class ScanScheduler:
+    """
+    Process-wide scan scheduler on the shared agent event loop.
+
+    - bounded: at most max_workers scans (OCR/GPT work) run at once
+    - prioritized: per task type (TASK_PRIORITIES), lowest value first
+    - fair: within a priority, sessions are served round-robin
+    - backpressure: more than max_queue waiting scans -> SchedulerBusy
+    """
+
+    def __init__(self, max_workers: int = 8, max_queue: int = 64):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._levels = {}               # priority -> OrderedDict[session_id, deque[_Job]]
+        self._depth = 0
+        self._running = 0
+        self._waits_ms = deque(maxlen=500)
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._lock = threading.Lock()   # metrics are read from Streamlit script threads
+
+    async def run(self, factory, *, task_type: str, session_id: str | None = None):
+        """
+        Queue factory() (returns a coroutine) and await its result.
+        Runs in the caller's context, so case stamps go to the caller's case.
+        """
+        context = contextvars.copy_context()
+        if session_id is None:
+            session_id = CURRENT_SESSION.get()
+        priority = TASK_PRIORITIES.get(task_type, DEFAULT_PRIORITY)
+
+        loop = get_loop()
+        if asyncio.get_running_loop() is not loop:
+            # callers on their own loop hop onto the scheduler loop
+            future = asyncio.run_coroutine_threadsafe(self._run(factory, priority, session_id, context), loop)
+            return await asyncio.wrap_future(future)
+        return await self._run(factory, priority, session_id, context)
+
+    async def _run(self, factory, priority, session_id, context):
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(factory, priority, session_id, context, future)
+
+        with self._lock:
+            if self._depth >= self.max_queue:
+                self._rejected += 1
+                raise SchedulerBusy(f"Scan queue is full ({self._depth} waiting). Please retry in a moment.")
+            sessions = self._levels.setdefault(priority, OrderedDict())
+            sessions.setdefault(session_id, deque()).append(job)
+            self._depth += 1
+
+        self._dispatch()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self._cancel(job)
+            raise
+
+    def _cancel(self, job):
+        if job.task is not None:
+            job.task.cancel()
+            return
+        with self._lock:
+            queue = self._levels.get(job.priority, {}).get(job.session_id)
+            if queue and job in queue:
+                queue.remove(job)
+                self._depth -= 1
+
+    def _next_job(self):
+        for priority in sorted(self._levels):
+            sessions = self._levels[priority]
+            while sessions:
+                session_id, queue = next(iter(sessions.items()))
+                job = queue.popleft()
+                if queue:
+                    sessions.move_to_end(session_id)  # round-robin between sessions
+                else:
+                    del sessions[session_id]
+                self._depth -= 1
+                return job
+        return None
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                if self._running >= self.max_workers:
+                    return
+                job = self._next_job()
+                if job is None:
+                    return
+                self._running += 1
+                self._waits_ms.append((time.monotonic() - job.enqueued_at) * 1000)
+            job.task = asyncio.get_running_loop().create_task(self._execute(job), context=job.context)
+
+    async def _execute(self, job):
+        CURRENT_PRIORITY.set(job.priority)
+        stamp_case("ts_scan_started")
+        try:
+            result = await job.factory()
+            if not job.future.done():
+                job.future.set_result(result)
+            ok = True
+        except BaseException as e:
+            if not job.future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    job.future.cancel()
+                else:
+                    job.future.set_exception(e)
+            ok = False
+        finally:
+            with self._lock:
+                self._running -= 1
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+            self._dispatch()
+
+    def metrics(self) -> dict:
+        """Queue depth / wait-time snapshot (safe to call from any thread)."""
+        with self._lock:
+            waits = sorted(self._waits_ms)
+            by_priority = {p: sum(len(q) for q in s.values()) for p, s in self._levels.items() if s}
+            return {
+                "queued": self._depth,
+                "running": self._running,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued_by_priority": by_priority,
+                "wait_p50_ms": waits[len(waits) // 2] if waits else 0.0,
+                "wait_p95_ms": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler() -> ScanScheduler:
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = ScanScheduler(
+                max_workers=int(os.getenv("SCAN_MAX_WORKERS", "8")),
+                max_queue=int(os.getenv("SCAN_MAX_QUEUE", "64")),
+            )
+    return _SCHEDULER
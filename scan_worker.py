@@ -0,0 +1,104 @@
+# scan_worker.py
+"""
+Scan worker service: runs the serial agents (OCR -> GPT pipeline, knowledge list) outside the UI.
+
+    OCR_API_URL=http://127.0.0.1:8500/scan_serial uvicorn scan_worker:app --port 8600 --workers 4
+
+Each worker process has its own agent loop, scheduler and connection pools; all processes
+share one results store (RESULTS_DIR) and vision cache. Streamlit replicas use it through
+scan_client.RemoteScanAgent when SCAN_WORKER_URL is set.
+"""
+import io
+import os
+import asyncio
+import importlib
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from PIL import Image
+
+from agent_runtime import CURRENT_CASE, CURRENT_SESSION, submit
+from scan_scheduler import get_scheduler, SchedulerBusy
+from rate_limiter import get_rate_limiter
+from scan_client import ocr_endpoints
+
+AGENTS = {
+    "SerialNumberAgent": ("serial_number_agent", "SerialNumberAgent"),
+    "SerialNumberKnowledgeAgent": ("serial_number_knowledge_agent", "SerialNumberKnowledgeAgent"),
+    "ScannerAgent": ("scanner_agent", "ScannerAgent"),
+}
+
+_agents = {}
+
+app = FastAPI(title="Aircraft inspection scan worker")
+
+
+def _get_agent(name: str):
+    if name not in AGENTS:
+        raise HTTPException(status_code=404, detail=f"Unknown agent {name!r}")
+    agent = _agents.get(name)
+    if agent is None:
+        module, cls = AGENTS[name]
+        agent = _agents[name] = getattr(importlib.import_module(module), cls)(**ocr_endpoints())
+    return agent
+
+
+def _decode(raw: bytes) -> Image.Image:
+    with Image.open(io.BytesIO(raw)) as im:
+        return im.convert("RGB")
+
+
+async def _run(files: list[UploadFile], agent_name: str, task_type: str, session_id: str, mode: str):
+    agent = _get_agent(agent_name)
+    raws = [await f.read() for f in files]
+    images = await asyncio.gather(*(asyncio.to_thread(_decode, raw) for raw in raws))
+
+    # stamps / usage of this request land here and are returned to the client
+    case = {}
+    CURRENT_CASE.set(case)
+    CURRENT_SESSION.set(session_id or None)
+    try:
+        if mode == "multi":
+            result = await agent.scan_multi_async(images[0], task_type=task_type or None)
+        elif mode == "consensus":
+            result = list(await agent.scan_consensus_async(list(images), task_type=task_type or None))
+        else:
+            result = list(await agent.scan_async(images[0], task_type=task_type or None))
+    except SchedulerBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"result": result, "case": case, "worker_pid": os.getpid()}
+
+
+@app.post("/scan")
+async def scan(file: UploadFile = File(...), agent: str = Form(...), task_type: str = Form(""),
+               session_id: str = Form("")):
+    return await _run([file], agent, task_type, session_id, mode="single")
+
+
+@app.post("/scan_multi")
+async def scan_multi(file: UploadFile = File(...), agent: str = Form(...), task_type: str = Form(""),
+                     session_id: str = Form("")):
+    return await _run([file], agent, task_type, session_id, mode="multi")
+
+
+@app.post("/scan_consensus")
+async def scan_consensus(files: list[UploadFile] = File(...), agent: str = Form(...), task_type: str = Form(""),
+                         session_id: str = Form("")):
+    """Multi-frame consensus scan: the last K camera frames of one plate, oldest first."""
+    return await _run(files, agent, task_type, session_id, mode="consensus")
+
+
+@app.post("/warmup")
+async def warmup(agent: str = Form(...)):
+    """Pre-open this process's OCR / OpenAI connections for the agent (called at camera start)."""
+    # pooled clients are per event loop: warm the agent loop the scheduler runs scans on, not uvicorn's
+    await asyncio.wrap_future(submit(_get_agent(agent).warm_up_async()))
+    return {"worker_pid": os.getpid()}
+
+
+@app.get("/health")
+def health():
+    return {
+        "worker_pid": os.getpid(),
+        "scheduler": get_scheduler().metrics(),
+        "rate_limiter": get_rate_limiter().metrics(),
+    }
@@ -1,4 +1,6 @@
 from PIL import Image
+from agent_runtime import run_sync
+from scan_scheduler import get_scheduler
 from serial_number_agent import SerialNumberAgent
 
 class ScannerAgent:
@@ -9,24 +11,32 @@ class ScannerAgent:
     """
 
     is_auto_save = True  # UI can use this to auto-save and hide review/edit
+    task_type = "scanner"  # highest scheduler priority (operator at the aircraft)
 
     def __init__(self, api_url: str = "http://168.119.242.186:8500/scan_serial",
                  ocr_early_accept_threshold: float = 0.95,
-                 min_ocr_conf_to_save: float | None = None):
+                 min_ocr_conf_to_save: float | None = None,
+                 batch_api_url: str | None = None):
         # Reuse the exact logic from SerialNumberAgent
         self.base = SerialNumberAgent(
             api_url=api_url,
             ocr_early_accept_threshold=ocr_early_accept_threshold,
+            batch_api_url=batch_api_url,
         )
         self.min_ocr_conf_to_save = min_ocr_conf_to_save
 
-    def scan(self, pil_img: Image.Image):
+    async def _scan(self, pil_img: Image.Image):
         """
         Returns (serial_number, ocr_conf).
         If min_ocr_conf_to_save is set and OCR confidence is below it, returns (None, ocr_conf).
         """
-        serial_number, ocr_conf = self.base.scan(pil_img)
+        return self._filter_weak(*await self.base._scan(pil_img))
+
+    async def _scan_consensus(self, frames: list):
+        """Multi-frame consensus variant of _scan() (same min_ocr_conf_to_save rule)."""
+        return self._filter_weak(*await self.base._scan_consensus(frames))
 
+    def _filter_weak(self, serial_number, ocr_conf):
         # Optional: don't save very weak OCR cases
         if self.min_ocr_conf_to_save is not None:
             if ocr_conf is None:
@@ -35,3 +45,37 @@ class ScannerAgent:
                 return None, float(ocr_conf)
 
         return serial_number, ocr_conf
+
+    async def _scan_multi(self, pil_img: Image.Image):
+        """
+        Multi-label variant: list of {"serial_number", "confidence", "bbox"}.
+        Candidates below min_ocr_conf_to_save (if set) are dropped.
+        """
+        candidates = await self.base._scan_multi(pil_img)
+        if self.min_ocr_conf_to_save is not None:
+            candidates = [c for c in candidates if c["confidence"] >= float(self.min_ocr_conf_to_save)]
+        return candidates
+
+    async def scan_async(self, pil_img: Image.Image, *, task_type: str | None = None):
+        return await get_scheduler().run(lambda: self._scan(pil_img), task_type=task_type or self.task_type)
+
+    async def scan_multi_async(self, pil_img: Image.Image, *, task_type: str | None = None):
+        return await get_scheduler().run(lambda: self._scan_multi(pil_img), task_type=task_type or self.task_type)
+
+    async def scan_consensus_async(self, frames: list, *, task_type: str | None = None):
+        return await get_scheduler().run(lambda: self._scan_consensus(frames), task_type=task_type or self.task_type)
+
+    async def warm_up_async(self):
+        await self.base.warm_up_async()
+
+    def scan(self, pil_img: Image.Image):
+        """Blocking wrapper around scan_async()."""
+        return run_sync(self.scan_async(pil_img))
+
+    def scan_multi(self, pil_img: Image.Image):
+        """Blocking wrapper around scan_multi_async()."""
+        return run_sync(self.scan_multi_async(pil_img))
+
+    def scan_consensus(self, frames: list):
+        """Blocking wrapper around scan_consensus_async()."""
+        return run_sync(self.scan_consensus_async(frames))
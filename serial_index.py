@@ -0,0 +1,91 @@
+# serial_index.py
+import bisect
+import threading
+
+
+def normalize_serial(text: str) -> str:
+    """Case- and whitespace-insensitive key ('11148 a' -> '11148A')."""
+    return "".join((text or "").split()).upper()
+
+
+class SerialPrefixIndex:
+    """
+    Prefix index over serial numbers for type-ahead.
+    Keys are kept in sorted lists (all serials, and the known ones separately) -> a prefix is a
+    contiguous range found with bisect, so lookups are O(log n + limit) and inserts are an insort.
+    """
+
+    def __init__(self):
+        self._keys = []       # sorted normalized serials
+        self._known = []      # sorted normalized known serials (ranked first by suggest)
+        self._entries = {}    # normalized -> (display value, source)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, serial: str, source: str = "saved"):
+        key = normalize_serial(serial)
+        if not key:
+            return
+        with self._lock:
+            if key in self._entries:
+                # a known-serials entry always wins over a saved one
+                if source == "known" and self._entries[key][1] != "known":
+                    self._entries[key] = (self._entries[key][0], "known")
+                    bisect.insort(self._known, key)
+                return
+            bisect.insort(self._keys, key)
+            if source == "known":
+                bisect.insort(self._known, key)
+            self._entries[key] = (serial.strip(), source)
+
+    def lookup(self, serial: str):
+        """(display value, source) for an exact (normalized) match, else None."""
+        return self._entries.get(normalize_serial(serial))
+
+    def suggest(self, prefix: str, limit: int = 8):
+        """Up to `limit` (display value, source) pairs starting with prefix; known serials first."""
+        key = normalize_serial(prefix)
+        if not key:
+            return []
+        out = self._prefix_range(self._known, key, limit)  # known matches anywhere in the range come first
+        if len(out) < limit:
+            known = set(out)
+            out += [k for k in self._prefix_range(self._keys, key, limit) if k not in known][:limit - len(out)]
+        return [self._entries[k] for k in out]
+
+    @staticmethod
+    def _prefix_range(keys: list, prefix: str, limit: int) -> list:
+        """First `limit` keys of a sorted list that start with prefix."""
+        start = bisect.bisect_left(keys, prefix)
+        return [k for k in keys[start:start + limit] if k.startswith(prefix)]  # matches are contiguous
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_serial_index() -> SerialPrefixIndex:
+    """
+    Process-wide index, built once from the known-serials list and all saved results,
+    then kept up to date incrementally whenever persistence.append_result saves a row.
+    """
+    global _INDEX
+    if _INDEX is not None:
+        return _INDEX
+
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            from knowledge_agent import KnowledgeAgent
+            import persistence
+
+            index = SerialPrefixIndex()
+            for serial in KnowledgeAgent().get_important_serials():
+                index.add(serial, source="known")
+            for row in persistence.iter_results():
+                index.add(row.get("serial_number") or "", source="saved")
+
+            persistence.add_save_listener(lambda row: index.add(str(row.get("serial_number") or ""), source="saved"))
+            _INDEX = index
+    return _INDEX
@@ -1,15 +1,18 @@
 import os
-import io
-import base64
-from datetime import datetime
-from zoneinfo import ZoneInfo
+import asyncio
 
-import requests
 from PIL import Image
 import openai
 import streamlit as st
 from dotenv import load_dotenv
 
+from agent_runtime import stamp_case as _stamp_case, mark_backend_unavailable, run_sync
+from scan_scheduler import get_scheduler
+from ocr_client import ocr_image, ocr_images, warm_up_ocr
+from vision_client import ask_vision, is_outage, warm_up_vision
+from label_regions import find_label_regions, collect_candidates, crop_to_serial
+from consensus import ocr_consensus
+
 
 # ===================== OpenAI key =====================
 try:
@@ -19,37 +22,26 @@ except st.runtime.secrets.StreamlitSecretNotFoundError:
     openai.api_key = os.getenv("OPENAI_API_KEY")
 
 
-# ===================== Timestamp helpers =====================
-VIENNA = ZoneInfo("Europe/Vienna")
-
-
-def _now_vienna_iso() -> str:
-    return datetime.now(VIENNA).isoformat(timespec="milliseconds")
-
-
-def _stamp_case(field: str) -> None:
-    """First-write-wins timestamp stamp into st.session_state.current_case[field]."""
-    try:
-        case = st.session_state.get("current_case")
-        if case is None:
-            return
-        if case.get(field) is None:
-            case[field] = _now_vienna_iso()
-    except Exception:
-        pass
-
-
 # ===================== Agent =====================
 class SerialNumberAgent:
+    task_type = "serial_number"  # scheduler priority class
+
+    # multi-frame consensus: frames that must read the same serial, character agreement, mean OCR confidence
+    consensus_min_agree = 2
+    consensus_min_agreement = 0.8
+    consensus_min_conf = 0.6
+
     def __init__(
         self,
         api_url: str = "http://168.119.242.186:8500/scan_serial",
         ocr_early_accept_threshold: float = 0.95,
+        batch_api_url: str | None = None,
     ):
         self.api_url = api_url
         self.ocr_early_accept_threshold = float(ocr_early_accept_threshold)
+        self.batch_api_url = batch_api_url  # optional OCR batch endpoint (multi-label mode)
 
-    def scan(self, pil_img: Image.Image):
+    async def _scan(self, pil_img: Image.Image):
         """
         Pipeline (timestamps):
           - ts_ocr_result: OCR server response received
@@ -59,7 +51,7 @@ class SerialNumberAgent:
         print("🔍 Starting serial number scan...")
 
         # 1) OCR
-        ocr_serial, ocr_conf = self._try_ocr_api(pil_img)
+        ocr_serial, ocr_conf, text_boxes = await self._try_ocr_api(pil_img)
         if ocr_conf is None:
             print("🚫 OCR server unavailable. Aborting serial number scan.")
             return None, 0.0
@@ -75,12 +67,45 @@ class SerialNumberAgent:
             # _stamp_case("ts_gpt_verification")  # do NOT stamp
             return ocr_serial, float(ocr_conf)
 
+        return await self._gpt_stages(pil_img, ocr_serial, ocr_conf, text_boxes)
+
+    async def _scan_consensus(self, frames: list):
+        """
+        Camera consensus mode: OCR the last K frames concurrently and vote per character.
+        GPT (on the newest frame that read the voted serial) only runs if the frames don't agree.
+        """
+        print(f"🔍 Starting multi-frame consensus scan ({len(frames)} frames)...")
+
+        vote = await ocr_consensus(
+            self.api_url, frames, batch_api_url=self.batch_api_url,
+            min_agree=self.consensus_min_agree, min_agreement=self.consensus_min_agreement,
+            min_conf=self.consensus_min_conf, early_accept=self.ocr_early_accept_threshold,
+        )
+        if not vote["answered"]:
+            mark_backend_unavailable("ocr")
+            print("🚫 OCR server unavailable. Aborting serial number scan.")
+            return None, 0.0
+        _stamp_case("ts_ocr_result")
+
+        print(f"🗳️ Consensus: {vote['serial']} ({vote['agreeing']}/{vote['answered']} frames agree, "
+              f"agreement {vote['agreement']:.2f}, conf {vote['confidence']:.2f})")
+        if vote["accepted"]:
+            print("✅ Frames agree. Skipping GPT.")
+            return vote["serial"], float(vote["confidence"])
+
+        return await self._gpt_stages(frames[vote["frame"]], vote["serial"], vote["confidence"], vote["text_boxes"])
+
+    async def _gpt_stages(self, pil_img: Image.Image, ocr_serial, ocr_conf, text_boxes):
+        """GPT extraction + verification of an OCR read that was not accepted on its own."""
+        # GPT stages only see the serial + its label when OCR sent text boxes
+        gpt_img = crop_to_serial(pil_img, text_boxes)
+
         # 2) GPT extraction
-        gpt_serial = self._gpt_extract_serial(pil_img)
+        gpt_serial = await self._gpt_extract_serial(gpt_img)
         print(f"🤖 GPT result: {gpt_serial}")
 
         # 3) GPT verification
-        verified_serial = self._gpt_verify_serial(pil_img, ocr_serial, gpt_serial)
+        verified_serial = await self._gpt_verify_serial(gpt_img, ocr_serial, gpt_serial)
         print(f"🧪 GPT verification: {verified_serial}")
 
         if verified_serial:
@@ -90,38 +115,65 @@ class SerialNumberAgent:
         print("⚠️ No reliable serial number detected.")
         return None, 0.0
 
-    # ----------------- internal helpers -----------------
+    async def _scan_multi(self, pil_img: Image.Image):
+        """
+        Multi-label mode: read every data plate (P/N, SER, MOD, ...) in one frame.
+        Label regions are cropped and OCR'd concurrently (one batch request if available).
+        Returns a list of {"serial_number", "confidence", "bbox"}, best first.
+        """
+        print("🔍 Starting multi-label scan...")
 
-    def _try_ocr_api(self, pil_img: Image.Image):
-        buffered = io.BytesIO()
-        pil_img.save(buffered, format="JPEG")
-        buffered.seek(0)
+        boxes = find_label_regions(pil_img) or [(0, 0, pil_img.width, pil_img.height)]
+        reads = await ocr_images(self.api_url, [pil_img.crop(b) for b in boxes], batch_api_url=self.batch_api_url)
+        if any(conf is not None for _, conf in reads):
+            _stamp_case("ts_ocr_result")
+        else:
+            mark_backend_unavailable("ocr")  # no crop answered: outage, not "no serial"
 
-        files = {"file": ("image.jpg", buffered, "image/jpeg")}
+        candidates = collect_candidates(boxes, reads)
+        print(f"📄 Multi-label OCR: {len(candidates)} candidate(s) from {len(boxes)} region(s)")
+        return candidates
 
-        try:
-            response = requests.post(self.api_url, files=files, timeout=10)
+    async def scan_async(self, pil_img: Image.Image, *, task_type: str | None = None):
+        """Scan through the process-wide scheduler (bounded, prioritized by task type)."""
+        return await get_scheduler().run(lambda: self._scan(pil_img), task_type=task_type or self.task_type)
 
-            if response.status_code != 200:
-                print(f"❌ OCR API error: {response.status_code} - {response.text}")
-                return None, None
+    async def scan_multi_async(self, pil_img: Image.Image, *, task_type: str | None = None):
+        return await get_scheduler().run(lambda: self._scan_multi(pil_img), task_type=task_type or self.task_type)
 
-            data = response.json()
-            serial_number = data.get("serial_number")
-            confidence = data.get("confidence", 0.0)
+    async def scan_consensus_async(self, frames: list, *, task_type: str | None = None):
+        """Consensus scan over several frames of the same plate (oldest first); same result as scan()."""
+        return await get_scheduler().run(lambda: self._scan_consensus(frames), task_type=task_type or self.task_type)
 
-            # ✅ OCR result returned from server
-            _stamp_case("ts_ocr_result")
+    async def warm_up_async(self):
+        """Pre-open OCR / OpenAI connections before the first scan (see agent_runtime.warm_up_in_background)."""
+        await asyncio.gather(warm_up_ocr(self.api_url), warm_up_vision())
 
-            return serial_number, confidence
+    def scan(self, pil_img: Image.Image):
+        """Blocking wrapper around scan_async() (runs on the shared agent event loop)."""
+        return run_sync(self.scan_async(pil_img))
 
-        except Exception as e:
-            print("❌ OCR API not reachable:", e)
-            return None, None
+    def scan_multi(self, pil_img: Image.Image):
+        """Blocking wrapper around scan_multi_async()."""
+        return run_sync(self.scan_multi_async(pil_img))
 
-    def _gpt_extract_serial(self, pil_img: Image.Image):
-        img_base64 = self._pil_to_base64_png(pil_img)
+    def scan_consensus(self, frames: list):
+        """Blocking wrapper around scan_consensus_async()."""
+        return run_sync(self.scan_consensus_async(frames))
 
+    # ----------------- internal helpers -----------------
+
+    async def _try_ocr_api(self, pil_img: Image.Image):
+        """(serial, confidence, text boxes or None) - boxes are used to crop the GPT input."""
+        serial_number, confidence, text_boxes = await ocr_image(self.api_url, pil_img, with_boxes=True)
+        if confidence is not None:
+            # ✅ OCR result returned from server
+            _stamp_case("ts_ocr_result")
+        else:
+            mark_backend_unavailable("ocr")
+        return serial_number, confidence, text_boxes
+
+    async def _gpt_extract_serial(self, pil_img: Image.Image):
         prompt = (
             "Extract the serial number from this image. "
             "It may be labeled as SER', 'SERNO', 'SER NO', 'SERIAL', 'S/N', 'ESN', etc. "
@@ -131,18 +183,7 @@ class SerialNumberAgent:
         )
 
         try:
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_base64}"}},
-                    ],
-                }],
-                max_tokens=50,
-            )
-            out = response.choices[0].message.content.strip()
+            out = await ask_vision(prompt, pil_img, model="gpt-4o", max_tokens=50, stage="extract")
 
             # ✅ GPT extraction returned
             _stamp_case("ts_gpt_result")
@@ -151,11 +192,11 @@ class SerialNumberAgent:
 
         except Exception as e:
             print("❌ Error calling GPT for extraction:", e)
+            if is_outage(e):
+                mark_backend_unavailable("openai")
             return None
 
-    def _gpt_verify_serial(self, pil_img: Image.Image, ocr_serial: str, gpt_serial: str):
-        img_base64 = self._pil_to_base64_png(pil_img)
-
+    async def _gpt_verify_serial(self, pil_img: Image.Image, ocr_serial: str, gpt_serial: str):
         prompt = (
             "You are given an image of a serial number label.\n"
             f"The OCR system extracted: `{ocr_serial}`\n"
@@ -166,18 +207,7 @@ class SerialNumberAgent:
         )
 
         try:
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_base64}"}},
-                    ],
-                }],
-                max_tokens=50,
-            )
-            answer = response.choices[0].message.content.strip()
+            answer = await ask_vision(prompt, pil_img, model="gpt-4o", max_tokens=50, stage="verify")
 
             # ✅ GPT verification returned
             _stamp_case("ts_gpt_verification")
@@ -188,10 +218,6 @@ class SerialNumberAgent:
 
         except Exception as e:
             print("❌ Error calling GPT for verification:", e)
+            if is_outage(e):
+                mark_backend_unavailable("openai")
             return None
-
-    @staticmethod
-    def _pil_to_base64_png(pil_img: Image.Image) -> str:
-        buffered = io.BytesIO()
-        pil_img.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
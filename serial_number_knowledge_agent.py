@@ -1,15 +1,19 @@
 import os
-import io
-import base64
-from datetime import datetime
-from zoneinfo import ZoneInfo
+import asyncio
 
-import requests
 from PIL import Image
 import openai
 import streamlit as st
 from dotenv import load_dotenv
 
+from agent_runtime import stamp_case as _stamp_case, mark_backend_unavailable, run_sync
+from scan_scheduler import get_scheduler
+from ocr_client import ocr_image, ocr_images, warm_up_ocr
+from vision_client import ask_vision, is_outage, warm_up_vision
+from label_regions import find_label_regions, collect_candidates, crop_to_serial
+from consensus import ocr_consensus
+from serial_index import normalize_serial
+
 from knowledge_agent import KnowledgeAgent
 
 
@@ -21,28 +25,9 @@ except st.runtime.secrets.StreamlitSecretNotFoundError:
     openai.api_key = os.getenv("OPENAI_API_KEY")
 
 
-# ===================== Timestamp helpers =====================
-VIENNA = ZoneInfo("Europe/Vienna")
-
-
-def _now_vienna_iso() -> str:
-    return datetime.now(VIENNA).isoformat(timespec="milliseconds")
-
-
-def _stamp_case(field: str) -> None:
-    """
-    Stamp a timestamp into the currently active test case (st.session_state.current_case).
-    First-write-wins: never overwrite a value that is already present.
-    """
-    try:
-        case = st.session_state.get("current_case")
-        if case is None:
-            return
-        if case.get(field) is None:
-            case[field] = _now_vienna_iso()
-    except Exception:
-        # keep agent usable outside Streamlit
-        pass
+def _is_known(serial, important_keys: set) -> bool:
+    """Knowledge check by key, so '11148 a' matches a listed '11148A'."""
+    return bool(serial) and normalize_serial(serial) in important_keys
 
 
 # ===================== Agent =====================
@@ -66,21 +51,34 @@ class SerialNumberKnowledgeAgent:
 
     Where:
       - is_known_good == True means: match in KnowledgeAgent list -> UI should auto-save
-      - source in {"ocr", "gpt", "verify", "none"}
+      - source in {"ocr", "consensus", "gpt", "verify", "none"}
       - confidence is ALWAYS PaddleOCR confidence
     """
 
-    def __init__(self, api_url: str = "http://168.119.242.186:8500/scan_serial"):
+    task_type = "serial_number_knowledge"  # scheduler priority class
+
+    # multi-frame consensus: frames that must read the same serial, character agreement, mean OCR confidence
+    consensus_min_agree = 2
+    consensus_min_agreement = 0.8
+    consensus_min_conf = 0.6
+
+    def __init__(self, api_url: str = "http://168.119.242.186:8500/scan_serial",
+                 batch_api_url: str | None = None):
         self.api_url = api_url
+        self.batch_api_url = batch_api_url  # optional OCR batch endpoint (multi-label mode)
         self.knowledge_agent = KnowledgeAgent()
 
-    def scan(self, pil_img: Image.Image):
+    def _important_keys(self) -> set:
+        """Knowledge list as normalize_serial() keys; every scan path matches reads against these."""
+        return {normalize_serial(s) for s in self.knowledge_agent.get_important_serials()}
+
+    async def _scan(self, pil_img: Image.Image):
         print("🔍 Starting knowledge-based serial number scan...")
 
-        important = set(self.knowledge_agent.get_important_serials())
+        important = self._important_keys()
 
         # 1) OCR
-        ocr_serial, ocr_conf = self._try_ocr_api(pil_img)
+        ocr_serial, ocr_conf, text_boxes = await self._try_ocr_api(pil_img)
         if ocr_conf is None:
             print("🚫 OCR server unavailable. Aborting scan.")
             return None, 0.0, False, "none"
@@ -89,27 +87,67 @@ class SerialNumberKnowledgeAgent:
             print(f"📄 OCR result: {ocr_serial} (Confidence: {ocr_conf:.2f})")
 
             # 2) Knowledge check after OCR
-            if ocr_serial in important:
+            if _is_known(ocr_serial, important):
                 print("✅ OCR matches Knowledge list. Auto-accepting.")
                 return ocr_serial, float(ocr_conf), True, "ocr"
 
+        return await self._gpt_stages(pil_img, ocr_serial, ocr_conf, text_boxes, important)
+
+    async def _scan_consensus(self, frames: list):
+        """
+        Camera consensus mode: OCR the last K frames concurrently and vote per character.
+        A voted serial on the Knowledge list is auto-accepted; frames that agree on another serial
+        are returned for review without GPT; GPT only runs if the frames don't agree.
+        """
+        print(f"🔍 Starting knowledge-based consensus scan ({len(frames)} frames)...")
+
+        important = self._important_keys()
+
+        vote = await ocr_consensus(
+            self.api_url, frames, batch_api_url=self.batch_api_url,
+            min_agree=self.consensus_min_agree, min_agreement=self.consensus_min_agreement,
+            min_conf=self.consensus_min_conf,
+        )
+        if not vote["answered"]:
+            mark_backend_unavailable("ocr")
+            print("🚫 OCR server unavailable. Aborting scan.")
+            return None, 0.0, False, "none"
+        _stamp_case("ts_ocr_result")
+
+        serial, conf = vote["serial"], float(vote["confidence"])
+        print(f"🗳️ Consensus: {serial} ({vote['agreeing']}/{vote['answered']} frames agree, "
+              f"agreement {vote['agreement']:.2f}, conf {conf:.2f})")
+        if _is_known(serial, important):
+            print("✅ Consensus matches Knowledge list. Auto-accepting.")
+            return serial, conf, True, "consensus"
+        if vote["accepted"]:
+            print("✅ Frames agree. Skipping GPT.")
+            return serial, conf, False, "consensus"
+
+        return await self._gpt_stages(frames[vote["frame"]], serial, conf, vote["text_boxes"], important)
+
+    async def _gpt_stages(self, pil_img: Image.Image, ocr_serial, ocr_conf, text_boxes, important: set):
+        """Steps 3-6 (GPT extraction / verification with Knowledge checks) for an OCR read."""
+        # GPT stages only see the serial + its label when OCR sent text boxes
+        gpt_img = crop_to_serial(pil_img, text_boxes)
+
         # 3) GPT extraction
-        gpt_serial = self._gpt_extract_serial(pil_img)
+        gpt_serial = await self._gpt_extract_serial(gpt_img)
         if gpt_serial:
             print(f"🤖 GPT result: {gpt_serial}")
 
             # 4) Knowledge check after GPT extraction
-            if gpt_serial in important:
+            if _is_known(gpt_serial, important):
                 print("✅ GPT extraction matches Knowledge list. Auto-accepting.")
                 return gpt_serial, float(ocr_conf), True, "gpt"
 
         # 5) GPT verification
-        verified = self._gpt_verify_serial(pil_img, ocr_serial, gpt_serial)
+        verified = await self._gpt_verify_serial(gpt_img, ocr_serial, gpt_serial)
         if verified:
             print(f"🧪 Verified serial number: {verified}")
 
             # 6) Knowledge check after verification
-            if verified in important:
+            if _is_known(verified, important):
                 print("✅ GPT verification matches Knowledge list. Auto-accepting.")
                 return verified, float(ocr_conf), True, "verify"
 
@@ -119,37 +157,70 @@ class SerialNumberKnowledgeAgent:
         print("⚠️ No reliable serial number detected.")
         return None, float(ocr_conf), False, "none"
 
-    # ----------------- internal helpers -----------------
+    async def _scan_multi(self, pil_img: Image.Image):
+        """
+        Multi-label mode: read every data plate in one frame (OCR only).
+        Returns a list of {"serial_number", "confidence", "bbox", "is_known_good", "source"}.
+        """
+        print("🔍 Starting knowledge-based multi-label scan...")
 
-    def _try_ocr_api(self, pil_img: Image.Image):
-        buffered = io.BytesIO()
-        pil_img.save(buffered, format="JPEG")
-        buffered.seek(0)
-        files = {"file": ("image.jpg", buffered, "image/jpeg")}
+        important = self._important_keys()
 
-        try:
-            response = requests.post(self.api_url, files=files, timeout=10)
+        boxes = find_label_regions(pil_img) or [(0, 0, pil_img.width, pil_img.height)]
+        reads = await ocr_images(self.api_url, [pil_img.crop(b) for b in boxes], batch_api_url=self.batch_api_url)
+        if any(conf is not None for _, conf in reads):
+            _stamp_case("ts_ocr_result")
+        else:
+            mark_backend_unavailable("ocr")  # no crop answered: outage, not "no serial"
 
-            if response.status_code != 200:
-                print(f"❌ OCR API error: {response.status_code} - {response.text}")
-                return None, None
+        candidates = collect_candidates(boxes, reads)
+        for c in candidates:
+            c["is_known_good"] = _is_known(c["serial_number"], important)
+            c["source"] = "ocr"
+        print(f"📄 Multi-label OCR: {len(candidates)} candidate(s) from {len(boxes)} region(s)")
+        return candidates
 
-            data = response.json()
-            serial_number = data.get("serial_number")
-            confidence = data.get("confidence", 0.0)
+    async def scan_async(self, pil_img: Image.Image, *, task_type: str | None = None):
+        """Scan through the process-wide scheduler (bounded, prioritized by task type)."""
+        return await get_scheduler().run(lambda: self._scan(pil_img), task_type=task_type or self.task_type)
 
-            # ✅ OCR result returned from server
-            _stamp_case("ts_ocr_result")
+    async def scan_multi_async(self, pil_img: Image.Image, *, task_type: str | None = None):
+        return await get_scheduler().run(lambda: self._scan_multi(pil_img), task_type=task_type or self.task_type)
 
-            return serial_number, confidence
+    async def scan_consensus_async(self, frames: list, *, task_type: str | None = None):
+        """Consensus scan over several frames of the same plate (oldest first); same result as scan()."""
+        return await get_scheduler().run(lambda: self._scan_consensus(frames), task_type=task_type or self.task_type)
 
-        except Exception as e:
-            print("❌ OCR API not reachable:", e)
-            return None, None
+    async def warm_up_async(self):
+        """Pre-open OCR / OpenAI connections and build the serial index before the first scan."""
+        from serial_index import get_serial_index
+        await asyncio.gather(warm_up_ocr(self.api_url), warm_up_vision(), asyncio.to_thread(get_serial_index))
+
+    def scan(self, pil_img: Image.Image):
+        """Blocking wrapper around scan_async() (runs on the shared agent event loop)."""
+        return run_sync(self.scan_async(pil_img))
+
+    def scan_multi(self, pil_img: Image.Image):
+        """Blocking wrapper around scan_multi_async()."""
+        return run_sync(self.scan_multi_async(pil_img))
 
-    def _gpt_extract_serial(self, pil_img: Image.Image):
-        img_base64 = self._pil_to_base64_png(pil_img)
+    def scan_consensus(self, frames: list):
+        """Blocking wrapper around scan_consensus_async()."""
+        return run_sync(self.scan_consensus_async(frames))
 
+    # ----------------- internal helpers -----------------
+
+    async def _try_ocr_api(self, pil_img: Image.Image):
+        """(serial, confidence, text boxes or None) - boxes are used to crop the GPT input."""
+        serial_number, confidence, text_boxes = await ocr_image(self.api_url, pil_img, with_boxes=True)
+        if confidence is not None:
+            # ✅ OCR result returned from server
+            _stamp_case("ts_ocr_result")
+        else:
+            mark_backend_unavailable("ocr")
+        return serial_number, confidence, text_boxes
+
+    async def _gpt_extract_serial(self, pil_img: Image.Image):
         # ✅ Improved prompt (label not part of the serial)
         prompt = (
             "Extract the serial number from this image.\n\n"
@@ -161,18 +232,7 @@ class SerialNumberKnowledgeAgent:
         )
 
         try:
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_base64}"}},
-                    ],
-                }],
-                max_tokens=50,
-            )
-            out = response.choices[0].message.content.strip()
+            out = await ask_vision(prompt, pil_img, model="gpt-4o", max_tokens=50, stage="extract")
 
             # ✅ GPT extraction returned
             _stamp_case("ts_gpt_result")
@@ -183,11 +243,11 @@ class SerialNumberKnowledgeAgent:
 
         except Exception as e:
             print("❌ Error calling GPT for extraction:", e)
+            if is_outage(e):
+                mark_backend_unavailable("openai")
             return None
 
-    def _gpt_verify_serial(self, pil_img: Image.Image, ocr_serial: str, gpt_serial: str):
-        img_base64 = self._pil_to_base64_png(pil_img)
-
+    async def _gpt_verify_serial(self, pil_img: Image.Image, ocr_serial: str, gpt_serial: str):
         prompt = (
             "You are given an image of a serial number label.\n"
             f"The OCR system extracted: `{ocr_serial}`\n"
@@ -197,18 +257,7 @@ class SerialNumberKnowledgeAgent:
         )
 
         try:
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_base64}"}},
-                    ],
-                }],
-                max_tokens=50,
-            )
-            answer = response.choices[0].message.content.strip()
+            answer = await ask_vision(prompt, pil_img, model="gpt-4o", max_tokens=50, stage="verify")
 
             # ✅ GPT verification returned
             _stamp_case("ts_gpt_verification")
@@ -219,10 +268,6 @@ class SerialNumberKnowledgeAgent:
 
         except Exception as e:
             print("❌ Error calling GPT for verification:", e)
+            if is_outage(e):
+                mark_backend_unavailable("openai")
             return None
-
-    @staticmethod
-    def _pil_to_base64_png(pil_img: Image.Image) -> str:
-        buffered = io.BytesIO()
-        pil_img.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
@@ -0,0 +1,195 @@
+# session_images.py
+import os
+import uuid
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from PIL import Image
+
+from image_ingest import decode_upload, decode_full, make_preview
+
+PREVIEW_MAX_SIDE = 480
+
+
+class FrameReleased(KeyError):
+    """The frame behind an ImageRef was released or expired - the UI should ask for a rescan."""
+
+
+@dataclass
+class ImageRef:
+    """
+    What st.session_state keeps for a captured frame: a small preview plus a key.
+    The full frame lives in the process-wide SessionImageStore (memory LRU + temp spill).
+    """
+    key: str
+    session_id: str | None
+    size: tuple          # (width, height) of the scan image
+    preview: Image.Image = field(repr=False)
+    has_original: bool = False  # raw upload bytes were kept (full-res decode on save)
+
+
+def _nbytes(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+class SessionImageStore:
+    """
+    Process-wide store for captured frames of all Streamlit sessions.
+    - every frame is spilled to a temp directory once (PNG, or the original upload bytes)
+    - decoded frames stay in memory while they fit in budget_bytes (least recently used evicted)
+    - previews are tiny and always in memory
+    - frames not used for max_age_s are dropped (sessions closed without clearing their state)
+    """
+
+    def __init__(self, budget_bytes: int = 256 * 1024 * 1024, max_age_s: float = 4 * 3600):
+        self.budget_bytes = budget_bytes
+        self.max_age_s = max_age_s
+        self.spill_dir = tempfile.mkdtemp(prefix="inspection_frames_")
+        atexit.register(shutil.rmtree, self.spill_dir, ignore_errors=True)
+        self._hot = OrderedDict()  # key -> decoded scan image
+        self._meta = {}            # key -> {"session_id", "mem", "disk", "path", "raw", "used"}
+        self._mem_total = 0
+        self._lock = threading.Lock()
+
+    # ----------------- public -----------------
+
+    def put(self, pil_img: Image.Image, session_id: str | None, raw: bytes | None = None) -> ImageRef:
+        key = uuid.uuid4().hex
+        if raw is not None:
+            path = os.path.join(self.spill_dir, f"{key}.orig")
+            with open(path, "wb") as f:
+                f.write(raw)
+        else:
+            path = os.path.join(self.spill_dir, f"{key}.png")
+            pil_img.save(path, format="PNG", compress_level=1)  # fast, lossless
+
+        ref = ImageRef(key, session_id, pil_img.size, make_preview(pil_img, PREVIEW_MAX_SIDE), raw is not None)
+        with self._lock:
+            self._meta[key] = {
+                "session_id": session_id, "mem": 0, "disk": os.path.getsize(path),
+                "path": path, "raw": raw is not None, "used": time.time(),
+            }
+            self._remember(key, pil_img)
+            self._drop_stale()
+        return ref
+
+    def load(self, ref: ImageRef) -> Image.Image:
+        """The scan-resolution frame (from memory, or reloaded from the spill file)."""
+        meta = self._touch(ref)
+        with self._lock:
+            img = self._hot.get(ref.key)
+            if img is not None:
+                self._hot.move_to_end(ref.key)
+                return img
+
+        img = self._read(ref, meta, full=False)
+        with self._lock:
+            if ref.key in self._meta:
+                self._remember(ref.key, img)
+        return img
+
+    def load_full(self, ref: ImageRef) -> Image.Image:
+        """Full-resolution frame for persisting (decodes the original upload if there is one)."""
+        meta = self._touch(ref)
+        if meta["raw"]:
+            return self._read(ref, meta, full=True)
+        return self.load(ref)
+
+    def alive(self, ref: ImageRef | None) -> bool:
+        with self._lock:
+            return ref is not None and ref.key in self._meta
+
+    def release(self, ref: ImageRef | None):
+        if ref is None:
+            return
+        with self._lock:
+            self._forget(ref.key)
+
+    def session_usage(self, session_id: str | None) -> dict:
+        with self._lock:
+            metas = [m for m in self._meta.values() if m["session_id"] == session_id]
+            return {
+                "images": len(metas),
+                "memory_bytes": sum(m["mem"] for m in metas),
+                "disk_bytes": sum(m["disk"] for m in metas),
+            }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "images": len(self._meta),
+                "hot_images": len(self._hot),
+                "memory_bytes": self._mem_total,
+                "budget_bytes": self.budget_bytes,
+                "disk_bytes": sum(m["disk"] for m in self._meta.values()),
+            }
+
+    # ----------------- internal (lock held) -----------------
+
+    def _touch(self, ref):
+        with self._lock:
+            meta = self._meta.get(ref.key)
+            if meta is None:
+                raise FrameReleased(f"frame {ref.key} was released")
+            meta["used"] = time.time()
+            return meta
+
+    def _remember(self, key, img):
+        if key in self._hot:
+            self._hot.move_to_end(key)  # another thread reloaded it first - count it once
+            return
+        nbytes = _nbytes(img)
+        if nbytes > self.budget_bytes:
+            return  # never keep a single frame bigger than the whole budget
+        self._hot[key] = img
+        self._meta[key]["mem"] = nbytes
+        self._mem_total += nbytes
+        while self._mem_total > self.budget_bytes:
+            old_key, _ = self._hot.popitem(last=False)
+            self._mem_total -= self._meta[old_key]["mem"]
+            self._meta[old_key]["mem"] = 0
+
+    def _forget(self, key):
+        meta = self._meta.pop(key, None)
+        if meta is None:
+            return
+        if self._hot.pop(key, None) is not None:
+            self._mem_total -= meta["mem"]
+        try:
+            os.remove(meta["path"])
+        except OSError:
+            pass
+
+    def _drop_stale(self):
+        cutoff = time.time() - self.max_age_s
+        for key in [k for k, m in self._meta.items() if m["used"] < cutoff]:
+            self._forget(key)
+
+    @staticmethod
+    def _read(ref, meta, full: bool) -> Image.Image:
+        try:
+            if meta["raw"]:
+                with open(meta["path"], "rb") as f:
+                    raw = f.read()
+                return decode_full(raw) if full else decode_upload(raw)
+            with Image.open(meta["path"]) as im:
+                return im.convert("RGB")
+        except FileNotFoundError:
+            raise FrameReleased(f"frame {ref.key} was released") from None
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_image_store() -> SessionImageStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = SessionImageStore(budget_bytes=int(float(os.getenv("SESSION_IMAGE_BUDGET_MB", "256")) * 1024 * 1024))
+    return _STORE
@@ -0,0 +1,110 @@
+# vision_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from PIL import Image
+
+from persistence import RESULTS_DIR
+
+CACHE_PATH = os.path.join(RESULTS_DIR, "vision_cache.sqlite3")
+
+# off     -> always call the model, store nothing
+# on      -> serve from the store if present, otherwise call and store (default)
+# record  -> always call the model and (over)write the store
+# replay  -> serve ONLY from the store; a miss raises VisionCacheMiss (no network, deterministic)
+MODES = ("off", "on", "record", "replay")
+
+
+class VisionCacheMiss(Exception):
+    """Replay mode: the request was never recorded."""
+
+
+def image_digest(pil_img: Image.Image) -> str:
+    """Content hash of the decoded pixels (independent of how the image was encoded)."""
+    h = hashlib.sha256(f"{pil_img.mode}:{pil_img.size}".encode())
+    h.update(pil_img.tobytes())
+    return h.hexdigest()
+
+
+def request_key(model: str, prompt: str, max_tokens: int, img_digest: str) -> str:
+    return hashlib.sha256(json.dumps([model, prompt, max_tokens, img_digest]).encode()).hexdigest()
+
+
+class VisionCache:
+    """
+    On-disk memo of vision-model answers (SQLite, one row per request key).
+    Least-recently-used rows are evicted once the stored payloads exceed max_bytes.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, model TEXT, payload TEXT, size INTEGER,"
+            " created REAL, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)")
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key: str):
+        """Stored payload dict, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT payload FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, model: str, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, model, payload, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, data, len(data), now, now),
+            )
+            self._total += len(data) - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, target: int):
+        rows = self._db.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self._total <= target:
+                break
+            doomed.append((key,))
+            self._total -= size
+        self._db.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"entries": n, "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def cache_mode() -> str:
+    mode = os.getenv("VISION_CACHE_MODE", "on").lower()
+    return mode if mode in MODES else "on"
+
+
+def get_vision_cache() -> VisionCache:
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = VisionCache(max_bytes=int(float(os.getenv("VISION_CACHE_MAX_MB", "256")) * 1024 * 1024))
+    return _CACHE
@@ -0,0 +1,122 @@
+# vision_client.py
+import io
+import math
+import base64
+import asyncio
+
+import openai
+from PIL import Image
+
+from agent_runtime import get_openai_client, add_case_usage
+from vision_cache import get_vision_cache, cache_mode, image_digest, request_key, VisionCacheMiss
+from rate_limiter import get_rate_limiter
+
+
+def is_outage(e: Exception) -> bool:
+    """
+    Network / server-side failure (worth queueing the capture), as opposed to a bad answer.
+    A 429 that outlasted the limiter's retries counts too; an exhausted quota does not.
+    """
+    if isinstance(e, openai.RateLimitError):
+        return getattr(e, "code", None) != "insufficient_quota"
+    return isinstance(e, (openai.APIConnectionError, openai.InternalServerError))
+
+
+# USD per 1M tokens (input, output) - list prices, for cost *estimates* only
+PRICES_PER_1M = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    price_in, price_out = PRICES_PER_1M.get(model, PRICES_PER_1M["gpt-4o"])
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+
+def estimate_tokens(prompt: str, size: tuple[int, int], max_tokens: int) -> int:
+    """Upper-bound token estimate of one vision request (gpt-4o high-detail tiling) for the rate limiter."""
+    w, h = size
+    scale = min(1.0, 2048 / max(w, h))
+    scale *= min(1.0, 768 / (min(w, h) * scale))
+    tiles = math.ceil(w * scale / 512) * math.ceil(h * scale / 512)
+    return 85 + 170 * tiles + len(prompt) // 3 + 10 + max_tokens
+
+
+def _record_usage(stage: str, model: str, response, payload_bytes: int):
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    add_case_usage(**{
+        f"usage_{stage}_prompt_tokens": prompt_tokens,
+        f"usage_{stage}_completion_tokens": completion_tokens,
+        f"usage_{stage}_bytes": payload_bytes,
+        "usage_cost_usd": estimate_cost(model, prompt_tokens, completion_tokens),
+    })
+
+
+async def warm_up_vision():
+    """Create the loop's OpenAI client, open its TLS connection (free models.list call) and the vision cache."""
+    mode = cache_mode()
+    if mode != "off":
+        await asyncio.to_thread(get_vision_cache)
+    if mode == "replay":
+        return  # offline by design
+    try:
+        await get_openai_client().models.list()
+    except Exception as e:
+        print("⚠️ OpenAI warm-up failed:", e)
+
+
+def _pil_to_base64_png(pil_img: Image.Image) -> str:
+    buffered = io.BytesIO()
+    pil_img.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+async def ask_vision(prompt: str, pil_img: Image.Image, *, model: str = "gpt-4o", max_tokens: int = 50,
+                     stage: str | None = None) -> str:
+    """
+    One prompt + one image -> the model's (stripped) text answer.
+    Uses the async OpenAI client of the running loop; errors propagate to the caller.
+    Answers are memoized on disk by (image content, prompt, model) - see vision_cache.
+    Model calls go through the process-wide rate limiter (waits / 429 retries instead of failing).
+    With a stage name ("extract" / "verify"), tokens, request bytes and estimated cost of a
+    real model call are added to the active case (cache hits cost nothing).
+    """
+    mode = cache_mode()
+    key = None
+    if mode != "off":
+        cache = get_vision_cache()
+        key = request_key(model, prompt, max_tokens, await asyncio.to_thread(image_digest, pil_img))
+        if mode in ("on", "replay"):
+            hit = await asyncio.to_thread(cache.get, key)
+            if hit is not None:
+                return hit["text"]
+        if mode == "replay":
+            raise VisionCacheMiss(f"replay mode: no recorded answer for {model} request {key[:12]}")
+
+    img_base64 = await asyncio.to_thread(_pil_to_base64_png, pil_img)  # PNG encoding is CPU work
+
+    client = get_openai_client().with_options(max_retries=0)  # the limiter retries, knowing about 429s
+    response = await get_rate_limiter().call(
+        lambda: client.chat.completions.create(
+            model=model,
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_base64}"}},
+                ],
+            }],
+            max_tokens=max_tokens,
+        ),
+        tokens=estimate_tokens(prompt, pil_img.size, max_tokens),
+    )
+    text = response.choices[0].message.content.strip()
+    if stage:
+        _record_usage(stage, model, response, len(img_base64) + len(prompt.encode("utf-8")))
+
+    if key is not None:
+        await asyncio.to_thread(cache.put, key, model, {"text": text})
+    return text